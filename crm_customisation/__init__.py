@@ -1,4 +1,5 @@
 # -*- coding: utf-8 -*-
 from . import models
 from . import controllers
-from . import wizard
\ No newline at end of file
+from . import wizard
+from . import tools
\ No newline at end of file
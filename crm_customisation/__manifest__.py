@@ -1,7 +1,7 @@
 # -*- coding: utf-8 -*-
 {
     'name': 'CRM Advanced Solution',
-    'version': '18.0.1.0.10',
+    'version': '18.0.1.0.11',
     'summary': 'Advanced material tracking with seamless sales integration, intelligent spreadsheets, and automated manufacturing reminders.',
     'description': '''
        Default List View.
@@ -23,6 +23,7 @@
         "security/ecpl_security.xml",
         "data/ir_sequence_data.xml",
         "data/reminder_email_cron.xml",
+        "data/sale_spreadsheet_cron.xml",
         "data/manufacturing_reminder_email.xml",
         # "data/email_template_crm_delivery_request.xml",
         "views/crm_lead_views.xml",
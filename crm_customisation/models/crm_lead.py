@@ -4,6 +4,9 @@ from odoo import api, fields, models
 import json
 import logging
 
+from ..tools.formula import ListReferenceRewriter
+from ..tools.line_matching import match_line_keys
+
 _logger = logging.getLogger(__name__)
 
 class CrmLead(models.Model):
@@ -96,20 +99,13 @@ class CrmLead(models.Model):
         """Create quotation with spreadsheet data transfer"""
         action = super(CrmLead, self).action_new_quotation()
         
-        # Prepare order lines from material lines
-        order_lines = []
-        for line in self.material_line_ids:
-            if line.product_id:
-                line_vals = {
-                    'product_id': line.product_id.id,
-                    'product_uom_qty': line.quantity or 1.0,
-                    'product_uom': line.product_uom_id.id if line.product_uom_id else False,
-                    'discount': line.discount or 0.0,
-                    'tax_id': line.tax_id or False,
-                    'price_unit': line.price,
-                    'name': line.description or line.product_id.name or "Product",
-                }
-                order_lines.append((0, 0, line_vals))
+        # Prepare order lines from material lines; the order creates them
+        # in one batch when saved
+        order_lines = [
+            (0, 0, vals)
+            for vals in self.material_line_ids.filtered('product_id')._prepare_sale_order_line_vals(
+                with_attachments=False)
+        ]
         
         # Find CRM spreadsheet
         crm_spreadsheet = self.env['crm.lead.spreadsheet'].search([
@@ -143,8 +139,11 @@ class CrmLead(models.Model):
         try:
             crm_data = json.loads(crm_spreadsheet.raw_spreadsheet_data)
             
-            # reate line ID mapping for ALL material lines
-            line_mapping = self._create_complete_line_id_mapping(sale_order)
+            # Create line ID mapping for ALL material lines; creates the
+            # missing order lines, a savepoint keeps a failure from
+            # aborting the caller's transaction
+            with self.env.cr.savepoint():
+                line_mapping = self._create_complete_line_id_mapping(sale_order)
             if not line_mapping:
                 return False
             
@@ -287,14 +286,14 @@ class CrmLead(models.Model):
         
         # Update cells with formulas and field references
         new_cells = {}
+        rewriter = ListReferenceRewriter(id_mapping, field_map)
         for cell_ref, cell_data in original_sheet.get('cells', {}).items():
             new_cell_data = cell_data.copy()
             
-            # Update formulas with new IDs and field names
+            # Update formulas with new IDs and field names, in one scan
             content = cell_data.get('content', '')
             if content and isinstance(content, str):
-                updated_content = self._update_formula_references(content, id_mapping, field_map)
-                new_cell_data['content'] = updated_content
+                new_cell_data['content'] = rewriter.rewrite(content)
             
             new_cells[cell_ref] = new_cell_data
         
@@ -322,132 +321,42 @@ class CrmLead(models.Model):
 
     def _update_formula_references(self, content, id_mapping, field_map):
         """Update formula references to new list IDs and field names"""
-        updated_content = content
-        
-        # Replace list IDs in ODOO formulas
-        for old_id, new_id in id_mapping.items():
-            # Handle ODOO.LIST.HEADER references
-            updated_content = updated_content.replace(
-                f'ODOO.LIST.HEADER({old_id},', 
-                f'ODOO.LIST.HEADER({new_id},'
-            )
-            # Handle ODOO.LIST references
-            updated_content = updated_content.replace(
-                f'ODOO.LIST({old_id},', 
-                f'ODOO.LIST({new_id},'
-            )
-            # Handle direct ID references
-            updated_content = updated_content.replace(
-                f'"{old_id}"', 
-                f'"{new_id}"'
-            )
-        
-        # Replace field names in formulas
-        for old_field, new_field in field_map.items():
-            # Handle quoted field names
-            updated_content = updated_content.replace(f'"{old_field}"', f'"{new_field}"')
-            # Handle unquoted field names in specific patterns
-            updated_content = updated_content.replace(f",{old_field},", f",{new_field},")
-            updated_content = updated_content.replace(f",{old_field})", f",{new_field})")
-        
-        return updated_content
+        return ListReferenceRewriter(id_mapping, field_map).rewrite(content)
 
     def _create_complete_line_id_mapping(self, sale_order):
-        """Create COMPLETE mapping for ALL material lines"""
+        """
+        Create COMPLETE mapping for ALL material lines: material lines are
+        matched with the order lines by product and dimensions (see
+        ``tools.line_matching``), order lines are created for the rest.
+        """
         self.ensure_one()
-        mapping = {}
         
         material_lines = self.material_line_ids.sorted('id')
         order_lines = sale_order.order_line.sorted('id')
         
-        
-        # Strategy 1: Exact match by product and ALL dimensions
-        used_order_lines = set()
-        used_material_lines = set()
-        
-        for mat_line in material_lines:
-            if mat_line.id in used_material_lines:
-                continue
-                
-            best_match = None
-            best_score = 0
-            
-            for order_line in order_lines:
-                if order_line.id in used_order_lines:
-                    continue
-                
-                score = 0
-                # Product match (highest priority)
-                if order_line.product_id == mat_line.product_id:
-                    score += 10
-                
-                # Dimension matches
-                if float(order_line.width or 0) == float(mat_line.width or 0):
-                    score += 2
-                if float(order_line.thickness or 0) == float(mat_line.thickness or 0):
-                    score += 2
-                if float(order_line.height or 0) == float(mat_line.height or 0):
-                    score += 2
-                if float(order_line.length or 0) == float(mat_line.length or 0):
-                    score += 2
-                if float(order_line.product_uom_qty or 0) == float(mat_line.quantity or 0):
-                    score += 1
-                
-                if score > best_score:
-                    best_score = score
-                    best_match = order_line
-            
-            if best_match and best_score >= 3:  
-                mapping[mat_line.id] = best_match.id
-                used_order_lines.add(best_match.id)
-                used_material_lines.add(mat_line.id)
-        
-        # Strategy 2: Product-only match for remaining lines
-        remaining_material = [ml for ml in material_lines if ml.id not in used_material_lines]
-        remaining_orders = [ol for ol in order_lines if ol.id not in used_order_lines]
-        
-        for mat_line in remaining_material:
-            for order_line in remaining_orders:
-                if order_line.product_id == mat_line.product_id:
-                    mapping[mat_line.id] = order_line.id
-                    used_order_lines.add(order_line.id)
-                    remaining_orders.remove(order_line)
-                    break
-        
-        # Strategy 3: Sequential mapping for any remaining lines
-        final_material = [ml for ml in material_lines if ml.id not in used_material_lines]
-        final_orders = [ol for ol in order_lines if ol.id not in used_order_lines]
-        
-        min_count = min(len(final_material), len(final_orders))
-        for i in range(min_count):
-            mapping[final_material[i].id] = final_orders[i].id
+        # Strategies 1-3: product and dimensions, product only, then in order
+        mapping = match_line_keys(
+            {ml.id: self._get_line_match_key(ml, ml.quantity) for ml in material_lines},
+            {ol.id: self._get_line_match_key(ol, ol.product_uom_qty) for ol in order_lines},
+        )
         
         # Strategy 4: Create missing order lines if needed
         if len(mapping) < len(material_lines):
-            unmapped_material = [ml for ml in material_lines if ml.id not in mapping]
-            
-            for mat_line in unmapped_material:
-                new_order_line = self.env['sale.order.line'].create({
-                    'order_id': sale_order.id,
-                    'product_id': mat_line.product_id.id,
-                    'product_uom_qty': mat_line.quantity or 1.0,
-                    'product_uom': mat_line.product_uom_id.id if mat_line.product_uom_id else False,
-                    'price_unit': mat_line.price or mat_line.product_id.list_price,
-                    'discount': mat_line.discount or 0.0,
-                    'tax_id': [(6, 0, mat_line.tax_id.ids)] if mat_line.tax_id else False,
-                    'width': mat_line.width or 0,
-                    'height': mat_line.height or 0,
-                    'length': mat_line.length or 0,
-                    'thickness': mat_line.thickness or 0,
-                    'raw_material': mat_line.raw_material or '',
-                    'raisin_type_id': mat_line.raisin_type_id.id if mat_line.raisin_type_id else False,
-                    'attached_file_id': mat_line.attached_file_id,
-                    'attached_file_name': mat_line.attached_file_name,
-                    'name': mat_line.description or mat_line.product_id.name or "Product",
-                })
-                mapping[mat_line.id] = new_order_line.id
+            unmapped_material = material_lines.filtered(lambda ml: ml.id not in mapping)
+            mapping.update(unmapped_material._materialize_order_lines(sale_order))
         
         return mapping
+
+    @api.model
+    def _get_line_match_key(self, line, quantity):
+        return (
+            line.product_id.id,
+            float(line.width or 0),
+            float(line.thickness or 0),
+            float(line.height or 0),
+            float(line.length or 0),
+            float(quantity or 0),
+        )
     
     def _create_sales_spreadsheet_with_data(self, sale_order):
         """Create sales spreadsheet with converted CRM data - FULLY FIXED"""
@@ -495,11 +404,12 @@ class CrmLead(models.Model):
         if existing_spreadsheet:
             _logger.info(f"ℹ️ Sales spreadsheet {existing_spreadsheet.id} already exists, updating...")
             try:
-                existing_spreadsheet.raw_spreadsheet_data = sales_data_json
-                
-                # Link CRM spreadsheet
-                if crm_spreadsheet.exists():
-                    crm_spreadsheet.sale_id = sale_order.id
+                with self.env.cr.savepoint():
+                    existing_spreadsheet.raw_spreadsheet_data = sales_data_json
+                    
+                    # Link CRM spreadsheet
+                    if crm_spreadsheet.exists():
+                        crm_spreadsheet.sale_id = sale_order.id
                     
                 _logger.info(f"✅ Updated existing spreadsheet {existing_spreadsheet.id}")
                 return existing_spreadsheet
@@ -510,22 +420,22 @@ class CrmLead(models.Model):
         
         # ✅ STEP 4: Create new Sales spreadsheet
         try:
-            sales_spreadsheet = self.env['sale.order.spreadsheet'].create({
-                'name': f"{sale_order.name} - Calculator",
-                'order_id': sale_order.id,
-                'raw_spreadsheet_data': sales_data_json,
-            })
-            
-            # Commit to ensure it exists
-            self.env.cr.commit()
+            # No commit: runs in the conversion job or the request opening
+            # the calculator, a savepoint keeps a failure from aborting it
+            with self.env.cr.savepoint():
+                sales_spreadsheet = self.env['sale.order.spreadsheet'].create({
+                    'name': f"{sale_order.name} - Calculator",
+                    'order_id': sale_order.id,
+                    'raw_spreadsheet_data': sales_data_json,
+                })
             
             _logger.info(f"✅ Created Sales spreadsheet: {sales_spreadsheet.id}")
             
             # ✅ STEP 5: Link CRM spreadsheet to Sale Order
             if crm_spreadsheet.exists():
                 try:
-                    crm_spreadsheet.sale_id = sale_order.id
-                    self.env.cr.commit()
+                    with self.env.cr.savepoint():
+                        crm_spreadsheet.sale_id = sale_order.id
                     _logger.info(f"✅ Linked CRM spreadsheet {crm_spreadsheet.id} to Sale {sale_order.id}")
                 except Exception as e:
                     _logger.error(f"⚠️ Failed to link CRM spreadsheet: {e}")
@@ -535,8 +445,6 @@ class CrmLead(models.Model):
             
         except Exception as e:
             _logger.error(f"❌ Failed to create Sales spreadsheet: {e}", exc_info=True)
-            # Rollback if creation failed
-            self.env.cr.rollback()
             return False
 
     @api.model
@@ -2,9 +2,14 @@
 from odoo import api, fields, models
 from odoo.exceptions import ValidationError
 
+from ..tools.list_data import read_list_rows
+
 import logging
 _logger = logging.getLogger(__name__) 
 
+# cr.precommit.data key of the spreadsheets to sync before commit ({id: 'full'|'columns'})
+SPREADSHEET_SYNC_PRECOMMIT_KEY = 'crm.material.line.spreadsheet_sync'
+
 class CrmMaterialLine(models.Model):
     _name = "crm.material.line"
     _description = "CRM Opportunity Material Line"
@@ -358,13 +363,15 @@ class CrmMaterialLine(models.Model):
         # Create records with processed values
         records = super().create(processed_vals_list)
         
-        # Trigger sync for related spreadsheets
-        for record in records:
-            if record.lead_id and record.lead_id.spreadsheet_ids:
-                for spreadsheet in record.lead_id.spreadsheet_ids:
-                    # Create sheet for the new line
-                    spreadsheet.with_context(material_line_id=record.id)._dispatch_insert_list_revision()
+        # Trigger sync for related spreadsheets: one revision per spreadsheet for all new lines
+        leads = records.lead_id
+        if 'spreadsheet_ids' in leads._fields:
+            for spreadsheet in leads.spreadsheet_ids:
+                spreadsheet._dispatch_insert_list_revisions(
+                    records.filtered(lambda r: r.lead_id == spreadsheet.lead_id)
+                )
 
+        for record in records:
             # Auto-populate Raisin Type if missing
             if not record.raisin_type_id and record.product_template_attribute_value_ids:
                 for ptav in record.product_template_attribute_value_ids:
@@ -433,49 +440,120 @@ class CrmMaterialLine(models.Model):
                 
                 _logger.info(f"✅ Updated attributes for record {record.id}: {current_map}")
         
-        # Trigger spreadsheet sync
-        for record in self:
-            spreadsheet_ids = getattr(record.lead_id, 'spreadsheet_ids', False)
-            if record.lead_id and spreadsheet_ids:
-                for spreadsheet in spreadsheet_ids:
-                    spreadsheet._sync_sheets_with_material_lines()
+        # Trigger spreadsheet sync (once per spreadsheet, at the end of the transaction)
+        self._schedule_spreadsheet_sync()
         
         return res
+
+    def _schedule_spreadsheet_sync(self):
+        """
+        Mark the spreadsheets of the leads of these lines dirty; each one is
+        synced once in a precommit hook, however many lines were written
+        during the transaction.
+
+        Writes saved from a spreadsheet carry its id in the
+        ``spreadsheet_origin_id`` context key: that spreadsheet already
+        shows the written values, so it only gets its column sets
+        reconciled instead of a full resync.
+        """
+        leads = self.lead_id
+        if 'spreadsheet_ids' not in leads._fields or not leads.spreadsheet_ids:
+            return
+        origin_id = self.env.context.get('spreadsheet_origin_id')
+        pending = self.env.cr.precommit.data.setdefault(SPREADSHEET_SYNC_PRECOMMIT_KEY, {})
+        if not pending:
+            self.env.cr.precommit.add(self._sync_dirty_spreadsheets)
+        for spreadsheet_id in leads.spreadsheet_ids.ids:
+            if origin_id and spreadsheet_id == int(origin_id):
+                pending.setdefault(spreadsheet_id, 'columns')
+            else:
+                pending[spreadsheet_id] = 'full'
+
+    def _sync_dirty_spreadsheets(self):
+        pending = self.env.cr.precommit.data.pop(SPREADSHEET_SYNC_PRECOMMIT_KEY, {})
+        spreadsheets = self.env['crm.lead.spreadsheet'].browse(sorted(pending)).exists()
+        _logger.info(f"🔄 Syncing {len(spreadsheets)} spreadsheets after material line writes")
+        for spreadsheet in spreadsheets:
+            spreadsheet._sync_sheets_with_material_lines(
+                column_set_only=pending[spreadsheet.id] == 'columns'
+            )
     
+    def _prepare_sale_order_line_vals(self, with_attachments=True):
+        """
+        Values of the order lines quoting these material lines, in order.
+
+        :param with_attachments: include the attached files (left out of
+            the values sent to the client as action context)
+        """
+        # not a material line field in every setup
+        has_raw_material = 'raw_material' in self._fields
+        vals_list = []
+        for line in self:
+            vals = {
+                'product_id': line.product_id.id,
+                'product_uom_qty': line.quantity or 1.0,
+                'product_uom': line.product_uom_id.id if line.product_uom_id else False,
+                'price_unit': line.price or line.product_id.list_price,
+                'discount': line.discount or 0.0,
+                'tax_id': [(6, 0, line.tax_id.ids)] if line.tax_id else False,
+                'width': line.width or 0,
+                'height': line.height or 0,
+                'length': line.length or 0,
+                'thickness': line.thickness or 0,
+                'raisin_type_id': line.raisin_type_id.id if line.raisin_type_id else False,
+                'name': line.description or line.product_id.name or "Product",
+            }
+            if has_raw_material:
+                vals['raw_material'] = line.raw_material or ''
+            if with_attachments:
+                vals['attached_file_id'] = line.attached_file_id
+                vals['attached_file_name'] = line.attached_file_name
+            vals_list.append(vals)
+        return vals_list
+
+    def _materialize_order_lines(self, order, skip_quoted_products=False):
+        """
+        Create the order lines quoting these material lines in ``order``,
+        with a single multi-create.
+
+        :param skip_quoted_products: only quote the products ``order`` does
+            not quote yet, once each; the products of its lines are indexed
+            once instead of searching its lines for every material line
+        :return: {material line id: created sale.order.line id}
+        """
+        lines = self
+        if skip_quoted_products:
+            quoted_product_ids = set(order.order_line.product_id.ids)
+            line_ids = []
+            for line in self:
+                if line.product_id and line.product_id.id not in quoted_product_ids:
+                    quoted_product_ids.add(line.product_id.id)
+                    line_ids.append(line.id)
+            lines = self.browse(line_ids)
+        if not lines:
+            return {}
+
+        vals_list = lines._prepare_sale_order_line_vals()
+        for vals in vals_list:
+            vals['order_id'] = order.id
+        order_lines = self.env['sale.order.line'].create(vals_list)
+        _logger.info(f"✅ Created {len(order_lines)} order lines in order {order.id} from material lines")
+        return dict(zip(lines.ids, order_lines.ids))
+
     @api.model
     def get_list_data(self, list_id, field_names):
         """
         Override to provide data including dynamic attributes from attributes_json
         """
         _logger.info(f"🟢 get_list_data called: list_id={list_id}, fields={field_names}")
-        
         try:
             line_id = int(list_id)
         except (ValueError, TypeError):
             _logger.error("Invalid list_id: %s", list_id)
             return []
 
-        line = self.browse(line_id)
-        if not line.exists():
+        row = read_list_rows(self, [(line_id, field_names)], attributes_field='attributes_json').get(line_id)
+        if not row:
             _logger.warning("Line %s not found", line_id)
             return []
-
-        row = {"id": line.id}
-
-        for field in field_names:
-            if field in self._fields:
-                # Standard field
-                val = line[field]
-                if hasattr(val, "display_name"):
-                    row[field] = val.display_name
-                else:
-                    row[field] = val
-                _logger.info(f"✅ Standard field '{field}' = '{row[field]}'")
-            else:
-                # Dynamic attribute from attributes_json
-                attrs = line.attributes_json or {}
-                row[field] = attrs.get(field, "")
-                _logger.info(f"🔵 Dynamic field '{field}' = '{row[field]}' from attributes_json")
-
-        _logger.info(f"🟢 Final row data: {row}")
-        return [row]
\ No newline at end of file
+        return [row]
@@ -2,6 +2,7 @@ from odoo import models,fields,api
 import json
 import openpyxl
 
+from ..tools.formula import FormulaShifter
 
 import logging
 _logger = logging.getLogger(__name__)
@@ -125,7 +126,6 @@ class ProductCategory(models.Model):
         # Import openpyxl and related modules
         try:
             import openpyxl
-            from openpyxl.formula.translate import Translator
             from openpyxl.utils import get_column_letter, column_index_from_string
             from openpyxl.worksheet.datavalidation import DataValidation
         except ImportError:
@@ -167,6 +167,7 @@ class ProductCategory(models.Model):
                 # Shift: Col +1, Row +5
                 SHIFT_COL = 1
                 SHIFT_ROW = 5
+                shifter = FormulaShifter(rows=SHIFT_ROW, cols=SHIFT_COL)
                 
                 # Helper to shift cell reference (e.g., "A1" -> "B6")
                 def shift_ref(ref):
@@ -210,8 +211,7 @@ class ProductCategory(models.Model):
                             if isinstance(cell_content, str) and cell_content.startswith('='):
                                 try:
                                     # Translate formula
-                                    original_ref = f"{get_column_letter(cell.column)}{cell.row}"
-                                    cell_content = Translator(cell_content, origin=original_ref).translate_formula(new_cell_ref)
+                                    cell_content = shifter.shift(cell_content)
                                 except Exception as e:
                                     _logger.warning(f"Failed to translate formula {cell_content}: {e}")
                             
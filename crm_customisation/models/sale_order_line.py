@@ -19,6 +19,8 @@ class SaleOrder(models.Model):
         )
     
     spreadsheet_id = fields.Many2one('sale.order.spreadsheet', 'Quote Calculator' ,store=True)
+    # Set at creation from an opportunity calculator, cleared once converted
+    spreadsheet_conversion_pending = fields.Boolean(copy=False, readonly=True)
 
     
     
@@ -47,37 +49,69 @@ class SaleOrder(models.Model):
                     order.opportunity_id = crm_lead_id
                     _logger.info(f"✅ Linked Sale Order {order.id} to Opportunity {crm_lead_id}")
         
-        # ✅ FIX 5: Create spreadsheet with proper error handling
+        # ✅ FIX 5: Convert the CRM calculator after commit, in a job: order
+        # creation does not wait for it nor commits half of a batch
         if crm_has_spreadsheet and crm_lead_id:
-            crm_lead = self.env['crm.lead'].browse(crm_lead_id)
-            
-            if not crm_lead.exists():
+            if not self.env['crm.lead'].browse(crm_lead_id).exists():
                 _logger.warning(f"⚠️ CRM Lead {crm_lead_id} not found")
                 return orders
             
-            for order in orders:
-                try:
-                    # ✅ FIX 6: Removed time.sleep - use commit instead
-                    self.env.cr.commit()
-                    
-                    # Refresh order to get latest data
-                    fresh_order = self.env['sale.order'].browse(order.id)
-                    
-                    # Create spreadsheet
-                    spreadsheet = crm_lead._create_sales_spreadsheet_with_data(fresh_order)
+            orders.spreadsheet_conversion_pending = True
+            cron = self.env.ref('crm_customisation.ir_cron_convert_sale_spreadsheets', raise_if_not_found=False)
+            if cron:
+                cron._trigger()
+            _logger.info(f"⏳ Spreadsheet conversion queued for orders {orders.ids}")
+        
+        return orders
+
+    @api.model
+    def _cron_convert_sale_spreadsheets(self, batch_size=20):
+        """Convert the CRM calculators of the orders created since the last run."""
+        orders = self.search([('spreadsheet_conversion_pending', '=', True)], limit=batch_size + 1)
+        orders[:batch_size]._convert_pending_spreadsheet()
+        if len(orders) > batch_size:
+            self.env.ref('crm_customisation.ir_cron_convert_sale_spreadsheets')._trigger()
+
+    def _convert_pending_spreadsheet(self):
+        """
+        Create the Sales calculator of orders from their opportunity's
+        calculator, once: the order row is locked and the pending flag read
+        again, so the job and a user opening the calculator never convert
+        the same order twice.
+        """
+        self.flush_recordset(['spreadsheet_conversion_pending'])
+        for order in self:
+            self.env.cr.execute(
+                "SELECT spreadsheet_conversion_pending FROM sale_order WHERE id = %s FOR UPDATE",
+                [order.id],
+            )
+            row = self.env.cr.fetchone()
+            order.invalidate_recordset(['spreadsheet_conversion_pending'])
+            if not row or not row[0]:
+                continue
+            
+            try:
+                # A database error rolls back this order only: the others of
+                # the batch are still converted
+                with self.env.cr.savepoint():
+                    spreadsheet = False
+                    if order.opportunity_id:
+                        # Order lines created for unmatched material lines keep their CRM taxes
+                        spreadsheet = order.opportunity_id.with_context(
+                            from_crm_lead=True
+                        )._create_sales_spreadsheet_with_data(order)
                     
                     if spreadsheet:
-                        _logger.info(f"✅ Spreadsheet {spreadsheet.id} created for order {fresh_order.id}")
+                        _logger.info(f"✅ Spreadsheet {spreadsheet.id} created for order {order.id}")
                     else:
-                        _logger.warning(f"⚠️ Spreadsheet creation returned False for order {fresh_order.id}")
-                        
-                except Exception as e:
-                    # ✅ FIX 7: Don't fail order creation if spreadsheet fails
-                    _logger.error(f"❌ Spreadsheet creation error for order {order.id}: {e}", exc_info=True)
-                    # Continue with next order
-                    continue
-        
-        return orders
+                        _logger.warning(f"⚠️ Spreadsheet creation returned False for order {order.id}")
+                    order.spreadsheet_conversion_pending = False
+                    
+            except Exception as e:
+                # ✅ FIX 7: Don't fail the other orders if spreadsheet fails;
+                # not pending anymore, so the job does not retry it forever
+                _logger.error(f"❌ Spreadsheet creation error for order {order.id}: {e}", exc_info=True)
+                order.spreadsheet_conversion_pending = False
     
     def action_open_spreadsheet_common(self):
         """
@@ -87,6 +121,11 @@ class SaleOrder(models.Model):
         
         _logger.info(f"\n🔵 [OPEN SPREADSHEET] Sale Order: {self.id}, Name: {self.name}")
         
+        # Conversion job not run yet: convert now (or wait for the job
+        # holding the order)
+        if self.spreadsheet_conversion_pending:
+            self._convert_pending_spreadsheet()
+        
         # ✅ FIX 8: Always search for existing spreadsheet first
         spreadsheet = self.env['sale.order.spreadsheet'].search([
             ('order_id', '=', self.id)
@@ -116,11 +155,12 @@ class SaleOrder(models.Model):
                     
                     if sales_data_json:
                         # Create new spreadsheet with converted data
-                        spreadsheet = self.env['sale.order.spreadsheet'].create({
-                            'name': f"{self.name} - Calculator",
-                            'order_id': self.id,
-                            'raw_spreadsheet_data': sales_data_json,
-                        })
+                        with self.env.cr.savepoint():
+                            spreadsheet = self.env['sale.order.spreadsheet'].create({
+                                'name': f"{self.name} - Calculator",
+                                'order_id': self.id,
+                                'raw_spreadsheet_data': sales_data_json,
+                            })
                         
                         _logger.info(f"✅ Created spreadsheet {spreadsheet.id} from CRM data")
                         return spreadsheet.action_open_spreadsheet()
@@ -0,0 +1,5 @@
+# -*- coding: utf-8 -*-
+
+from . import test_formula_shifter
+from . import test_line_matching
+from . import test_list_reference_rewriter
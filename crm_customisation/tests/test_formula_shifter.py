@@ -0,0 +1,93 @@
+# -*- coding: utf-8 -*-
+from openpyxl.formula.translate import Translator, TranslatorError
+
+from odoo.tests.common import BaseCase
+
+from odoo.addons.crm_customisation.tools.formula import FormulaShifter
+
+# (rows, cols) offsets the template importers use, plus negative ones
+OFFSETS = [(4, 0), (5, 1), (1, 3), (-1, 0), (0, -1), (12, 27)]
+
+
+class TestFormulaShifter(BaseCase):
+    """FormulaShifter must shift formulas exactly like openpyxl's Translator."""
+
+    def assertTranslatorParity(self, formulas, offsets=OFFSETS):
+        for formula in formulas:
+            for rows, cols in offsets:
+                with self.subTest(formula=formula, rows=rows, cols=cols):
+                    try:
+                        expected = Translator(formula, origin='A1').translate_formula(
+                            row_delta=rows, col_delta=cols)
+                    except TranslatorError:
+                        # moved out of the sheet
+                        with self.assertRaises(TranslatorError):
+                            FormulaShifter(rows, cols).shift(formula)
+                        continue
+                    self.assertEqual(FormulaShifter(rows, cols).shift(formula), expected)
+
+    def test_relative_references(self):
+        self.assertTranslatorParity([
+            '=B2',
+            '=B2+C3*D4',
+            '=SUM(B2,C3)-AB12',
+            '=IF(B2>0,C2/B2,0)',
+            '=b2+c3',
+        ])
+
+    def test_absolute_references(self):
+        self.assertTranslatorParity([
+            '=$B$2',
+            '=$B$2*$C$3',
+            '=SUM($B$2:$D$9)',
+        ])
+
+    def test_mixed_references(self):
+        self.assertTranslatorParity([
+            '=$B2+B$2',
+            '=SUM($B2:D$9)',
+            '=VLOOKUP($B2,$E$2:$F$50,2,FALSE)*C$1',
+        ])
+
+    def test_ranges(self):
+        self.assertTranslatorParity([
+            '=SUM(B2:D9)',
+            '=SUM(B:D)',
+            '=SUM($B:D)',
+            '=SUM(2:5)',
+            '=SUM($2:5)',
+            '=INDEX(B2:D9,MATCH(F2,B2:B9,0),3)',
+        ])
+
+    def test_cross_sheet_references(self):
+        self.assertTranslatorParity([
+            '=Sheet2!B2',
+            "='Profile Master'!B2+C3",
+            "=VLOOKUP(B2,'Profile Master'!$A$2:$D$500,4,FALSE)",
+            "=SUM('it''s here'!B2:C9)",
+            '=Resin!A:C',
+        ])
+
+    def test_untouched_tokens(self):
+        self.assertTranslatorParity([
+            '="B2"&C3',
+            '=LOG10(B2)+ATAN2(C3,D4)',
+            '=tax2023*B2',
+            '={1,2;3,4}',
+            '=B2%',
+            'B2',
+            '12',
+        ])
+
+    def test_out_of_sheet(self):
+        for formula in ['=B2', '=SUM(B2:C3)', '=B:C']:
+            with self.subTest(formula=formula):
+                with self.assertRaises(TranslatorError):
+                    Translator(formula, origin='A1').translate_formula(row_delta=-5, col_delta=-5)
+                with self.assertRaises(TranslatorError):
+                    FormulaShifter(-5, -5).shift(formula)
+
+    def test_local_only(self):
+        shifter = FormulaShifter(4, 0, local_only=True)
+        self.assertEqual(shifter.shift('=B2+Sheet2!B2'), '=B6+Sheet2!B2')
+        self.assertEqual(shifter.shift("=SUM(B2:C3)+'Profile Master'!$A$2:D9"), "=SUM(B6:C7)+'Profile Master'!$A$2:D9")
@@ -0,0 +1,121 @@
+# -*- coding: utf-8 -*-
+import logging
+import random
+import time
+
+from odoo.tests import tagged
+from odoo.tests.common import BaseCase
+
+from odoo.addons.crm_customisation.tools.line_matching import match_line_keys
+
+_logger = logging.getLogger(__name__)
+
+
+def shuffled(keys, seed):
+    items = list(keys.items())
+    random.Random(seed).shuffle(items)
+    return dict(items)
+
+
+def generate_lines(count, seed=0):
+    """
+    {material id: key} and {order id: key} of ``count`` lines quoted as
+    they are, 10% of the quantities edited on the order.
+    """
+    rnd = random.Random(seed)
+    material, orders = {}, {}
+    for index in range(count):
+        key = (
+            rnd.randint(1, 50),
+            rnd.choice([500, 750, 1000, 1250]),
+            rnd.choice([4, 6, 8]),
+            rnd.choice([1000, 1500, 2000]),
+            rnd.randint(1, 40) * 100,
+            rnd.randint(1, 10),
+        )
+        material[index + 1] = key
+        if rnd.random() < 0.1:
+            key = key[:5] + (key[5] + 1,)
+        orders[count + index + 1] = key
+    return material, orders
+
+
+class TestLineMatching(BaseCase):
+
+    def test_same_product_before_other_products(self):
+        material = {1: (1, 10, 2, 5, 100, 3)}
+        orders = {
+            11: (2, 10, 2, 5, 100, 3),  # other product, every dimension equal
+            12: (1, 99, 9, 9, 9, 7),    # same product, nothing else equal
+        }
+        self.assertEqual(match_line_keys(material, orders), {1: 12})
+
+    def test_more_equal_dimensions_first(self):
+        material = {1: (1, 10, 2, 5, 100, 3)}
+        orders = {
+            11: (1, 10, 0, 0, 0, 3),    # one dimension and the quantity
+            12: (1, 10, 2, 5, 999, 1),  # three dimensions
+        }
+        self.assertEqual(match_line_keys(material, orders), {1: 12})
+
+    def test_equal_quantity_first_within_a_bucket(self):
+        material = {1: (1, 10, 2, 5, 100, 3), 2: (1, 10, 2, 5, 100, 4)}
+        orders = {11: (1, 10, 2, 5, 100, 4), 12: (1, 10, 2, 5, 100, 3)}
+        self.assertEqual(match_line_keys(material, orders), {1: 12, 2: 11})
+
+    def test_other_products_by_shared_dimensions(self):
+        material = {1: (1, 10, 2, 5, 100, 3)}
+        orders = {
+            11: (2, 10, 9, 9, 9, 3),    # one dimension and the quantity
+            12: (3, 10, 2, 9, 9, 7),    # two dimensions
+        }
+        self.assertEqual(match_line_keys(material, orders), {1: 12})
+
+    def test_pairing_does_not_depend_on_input_order(self):
+        material, orders = generate_lines(200, seed=1)
+        expected = match_line_keys(material, orders)
+        for seed in range(5):
+            with self.subTest(seed=seed):
+                self.assertEqual(
+                    match_line_keys(shuffled(material, seed), shuffled(orders, seed + 100)),
+                    expected,
+                )
+
+    def test_surplus_material_lines_left_out(self):
+        material = {
+            1: (1, 10, 2, 5, 100, 3),
+            2: (1, 10, 2, 5, 100, 3),
+            3: (7, 1, 1, 1, 1, 1),
+        }
+        orders = {11: (1, 10, 2, 5, 100, 3), 12: (1, 10, 2, 5, 100, 3)}
+        self.assertEqual(match_line_keys(material, orders), {1: 11, 2: 12})
+
+    def test_every_line_used_once(self):
+        material, orders = generate_lines(300, seed=2)
+        del orders[max(orders)]
+        mapping = match_line_keys(material, orders)
+        self.assertEqual(len(mapping), len(orders))
+        self.assertEqual(set(mapping.values()), set(orders))
+
+    def test_no_lines(self):
+        self.assertEqual(match_line_keys({}, {1: (1, 0, 0, 0, 0, 1)}), {})
+        self.assertEqual(match_line_keys({1: (1, 0, 0, 0, 0, 1)}, {}), {})
+
+
+@tagged('-standard', 'crm_benchmark')
+class TestLineMatchingBenchmark(BaseCase):
+    """Run with ``--test-tags crm_benchmark``."""
+
+    def test_match_1000_lines(self):
+        material, orders = generate_lines(1000, seed=3)
+        orders = shuffled(orders, 3)
+        start = time.perf_counter()
+        mapping = match_line_keys(material, orders)
+        elapsed = time.perf_counter() - start
+        _logger.info(f"⏱️ Matched {len(mapping)} of 1000 lines in {elapsed * 1000:.1f} ms")
+
+        self.assertEqual(len(mapping), 1000)
+        self.assertEqual(len(set(mapping.values())), 1000)
+        # Only quantities were edited: every line keeps its product and dimensions
+        for material_id, order_id in mapping.items():
+            self.assertEqual(material[material_id][:5], orders[order_id][:5])
@@ -0,0 +1,81 @@
+# -*- coding: utf-8 -*-
+from odoo.tests.common import BaseCase
+
+from odoo.addons.crm_customisation.tools.formula import ListReferenceRewriter
+
+FIELD_MAP = {
+    'product_template_id': 'product_id',
+    'quantity': 'product_uom_qty',
+    'price': 'price_unit',
+    'width': 'width',
+}
+
+
+def chained_replace(content, id_mapping, field_map):
+    """The str.replace remapping ListReferenceRewriter replaced."""
+    for old_id, new_id in id_mapping.items():
+        content = content.replace(f'ODOO.LIST.HEADER({old_id},', f'ODOO.LIST.HEADER({new_id},')
+        content = content.replace(f'ODOO.LIST({old_id},', f'ODOO.LIST({new_id},')
+        content = content.replace(f'"{old_id}"', f'"{new_id}"')
+    for old_field, new_field in field_map.items():
+        content = content.replace(f'"{old_field}"', f'"{new_field}"')
+        content = content.replace(f",{old_field},", f",{new_field},")
+        content = content.replace(f",{old_field})", f",{new_field})")
+    return content
+
+
+class TestListReferenceRewriter(BaseCase):
+
+    def rewrite(self, content, id_mapping, field_map=FIELD_MAP):
+        return ListReferenceRewriter(id_mapping, field_map).rewrite(content)
+
+    def test_parity_with_chained_replace(self):
+        # mappings without chains, the replace loops were right on them
+        id_mapping = {'5': '41', 'sheet_5': 'sheet_sales_41', '6': '42', 'sheet_6': 'sheet_sales_42'}
+        contents = [
+            '=ODOO.LIST.HEADER(5,"quantity")',
+            '=ODOO.LIST(5,1,"price")*ODOO.LIST(6,1,"quantity")',
+            '=ODOO.LIST(5,1,"width")/1000+B4',
+            '=IF(ODOO.LIST(6,1,"product_template_id")="","-",ODOO.LIST(6,1,"product_template_id"))',
+            '=VLOOKUP(ODOO.LIST(5,1,"width"),\'Profile Master\'!A2:D500,4,FALSE)',
+            '=SUM(B2:B9)',
+            '"sheet_5"',
+            'Quantity',
+            '',
+        ]
+        for content in contents:
+            with self.subTest(content=content):
+                self.assertEqual(self.rewrite(content, id_mapping), chained_replace(content, id_mapping, FIELD_MAP))
+
+    def test_prefix_ids(self):
+        id_mapping = {'1': '101', '10': '110'}
+        self.assertEqual(
+            self.rewrite('=ODOO.LIST(1,1,"price")+ODOO.LIST(10,1,"price")', id_mapping),
+            '=ODOO.LIST(101,1,"price_unit")+ODOO.LIST(110,1,"price_unit")',
+        )
+        self.assertEqual(self.rewrite('=ODOO.LIST.HEADER(10,"width")', {'1': '101'}), '=ODOO.LIST.HEADER(10,"width")')
+        self.assertEqual(self.rewrite('"10"', {'1': '101'}), '"10"')
+        self.assertEqual(self.rewrite('"sheet_10"', {'sheet_1': 'sheet_sales_101'}), '"sheet_10"')
+
+    def test_overlapping_remaps(self):
+        # each reference is remapped once, from the original content
+        id_mapping = {'1': '2', '2': '3'}
+        self.assertEqual(
+            self.rewrite('=ODOO.LIST(1,1,"price")+ODOO.LIST(2,1,"price")', id_mapping),
+            '=ODOO.LIST(2,1,"price_unit")+ODOO.LIST(3,1,"price_unit")',
+        )
+        self.assertEqual(self.rewrite('=CONCAT("1","2")', id_mapping), '=CONCAT("2","3")')
+        self.assertEqual(
+            self.rewrite('=ODOO.LIST(7,1,"price")', {}, {'price': 'quantity', 'quantity': 'price'}),
+            '=ODOO.LIST(7,1,"quantity")',
+        )
+
+    def test_field_references(self):
+        self.assertEqual(
+            self.rewrite('=ODOO.LIST(7,1,quantity)+ODOO.LIST(7,1,price,quantity)', {}),
+            '=ODOO.LIST(7,1,product_uom_qty)+ODOO.LIST(7,1,price_unit,product_uom_qty)',
+        )
+        # only whole names are fields, and string literals are left alone
+        self.assertEqual(self.rewrite('=ODOO.LIST(7,1,"unit_price")', {}), '=ODOO.LIST(7,1,"unit_price")')
+        self.assertEqual(self.rewrite('="a,price,b"', {}), '="a,price,b"')
+        self.assertEqual(self.rewrite('=ODOO.LIST(7,1,prices)', {}), '=ODOO.LIST(7,1,prices)')
@@ -0,0 +1,5 @@
+# -*- coding: utf-8 -*-
+
+from . import formula
+from . import line_matching
+from . import list_data
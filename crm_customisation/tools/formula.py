@@ -0,0 +1,234 @@
+# -*- coding: utf-8 -*-
+"""
+Spreadsheet formula helpers shared by the CRM calculator modules.
+
+Formulas are scanned once with a single precompiled pattern; only string
+literals and sheet-qualified references are tokenized, everything else is
+copied through untouched.
+"""
+import re
+
+_SHEET_REF_RE = re.compile(r"""
+      (?P<string>"(?:[^"]|"")*")
+    | (?:
+          '(?P<qname>(?:[^']|'')+)'
+        | (?<![\w.])(?P<name>[^\W\d][\w.]*)
+      )
+      !
+      (?P<ref>
+          (?P<c1>\$?[A-Za-z]{1,3})(?P<r1>\$?)(?P<n1>\d+)
+          (?::(?P<c2>\$?[A-Za-z]{1,3})(?P<r2>\$?)(?P<n2>\d+))?
+          (?![\w(])
+      )?
+    | (?P<dquote>'')
+""", re.VERBOSE)
+
+# Sheet names that can be written without quotes in a reference
+_PLAIN_SHEET_NAME_RE = re.compile(r"[^\W\d][\w]*\Z")
+
+
+def quote_sheet_name(name):
+    """Quote a sheet name for use in a reference, escaping embedded quotes."""
+    return "'%s'" % name.replace("'", "''")
+
+
+class FormulaRewriter:
+    """
+    Rewrite sheet-qualified references of formulas in a single pass.
+
+    :param sheet_renames: {old sheet name: new sheet name}; renamed
+        references are always emitted quoted
+    :param row_shifts: {sheet name: row offset} applied to both ends of
+        references qualified with that sheet, ``$`` anchored rows included
+        (the sheet content itself moved)
+
+    Sheet names are matched case-insensitively, like spreadsheet
+    applications do. References needing quotes are quoted, ``==`` prefixes
+    are collapsed and stray ``''`` outside strings and sheet names become
+    ``'``. String literals are never modified.
+    """
+
+    def __init__(self, sheet_renames=None, row_shifts=None):
+        self.sheet_renames = {
+            old.lower(): new for old, new in (sheet_renames or {}).items()
+            if old and new and old != new
+        }
+        self.row_shifts = {
+            name.lower(): offset for name, offset in (row_shifts or {}).items()
+            if name and offset
+        }
+
+    def rewrite(self, content):
+        if not content or not isinstance(content, str) or not content.startswith('='):
+            return content
+        # Ensure no double equals (prevents #BAD EXPR)
+        if content.startswith("=="):
+            content = content[1:]
+        if "!" not in content and "''" not in content:
+            return content
+        return _SHEET_REF_RE.sub(self._replace, content)
+
+    def _replace(self, match):
+        if match.group('string') is not None:
+            return match.group('string')
+        if match.group('dquote') is not None:
+            return "'"
+
+        quoted = match.group('qname')
+        name = quoted.replace("''", "'") if quoted is not None else match.group('name')
+        key = name.lower()
+
+        new_name = self.sheet_renames.get(key)
+        if new_name is not None:
+            sheet = quote_sheet_name(new_name)
+        elif quoted is not None or not _PLAIN_SHEET_NAME_RE.match(name):
+            sheet = quote_sheet_name(name)
+        else:
+            sheet = name
+
+        if match.group('ref') is None:
+            return f"{sheet}!"
+
+        offset = self.row_shifts.get(key, 0)
+        ref = f"{match.group('c1')}{match.group('r1')}{int(match.group('n1')) + offset}"
+        if match.group('c2'):
+            ref += f":{match.group('c2')}{match.group('r2')}{int(match.group('n2')) + offset}"
+        return f"{sheet}!{ref}"
+
+
+_LIST_REF_RE = re.compile(r"""
+      (?P<func>ODOO\.LIST(?:\.HEADER)?\()(?P<list_id>[\w.]+)(?=,)
+    | "(?P<quoted>(?:[^"]|"")*)"
+    | (?<=,)(?P<field>[^\W\d]\w*)(?=[,)])
+""", re.VERBOSE)
+
+
+class ListReferenceRewriter:
+    """
+    Point the Odoo list references of cell contents at other lists and
+    fields in a single pass.
+
+    :param list_ids: {old id: new id} for the list ids of ``ODOO.LIST(`` and
+        ``ODOO.LIST.HEADER(`` and for quoted ids (``"12"``, ``"sheet_12"``)
+    :param field_names: {old field: new field} for quoted field names and
+        bare ones between commas or before a closing parenthesis
+
+    Every reference is looked up once in the original content: a rewritten
+    id is never rewritten again by another entry, and ids only match whole.
+    """
+
+    def __init__(self, list_ids=None, field_names=None):
+        self.list_ids = {str(old): str(new) for old, new in (list_ids or {}).items()}
+        self.field_names = dict(field_names or {})
+        self.quoted = dict(self.field_names, **self.list_ids)
+
+    def rewrite(self, content):
+        if not content or not isinstance(content, str):
+            return content
+        return _LIST_REF_RE.sub(self._replace, content)
+
+    def _replace(self, match):
+        if match.group('func'):
+            return match.group('func') + self.list_ids.get(match.group('list_id'), match.group('list_id'))
+        quoted = match.group('quoted')
+        if quoted is not None:
+            return f'"{self.quoted.get(quoted, quoted)}"'
+        return self.field_names.get(match.group('field'), match.group('field'))
+
+
+_RELATIVE_REF_PATTERN = r"""
+      (?P<string>"(?:[^"]|"")*")
+    | (?P<sheet>'(?:[^']|'')*')
+    | (?P<unsupported>\[)
+    | (?<![\w.$#])
+      (?:
+          (?P<col>\$?[A-Za-z]{1,3})(?P<row>\$?[1-9]\d{0,6})
+        | (?P<col1>\$?[A-Za-z]{1,3}):(?P<col2>\$?[A-Za-z]{1,3})
+        | (?P<row1>\$?[1-9]\d{0,6}):(?P<row2>\$?[1-9]\d{0,6})
+      )
+      (?![\w.(!])
+"""
+_RELATIVE_REF_RE = re.compile(_RELATIVE_REF_PATTERN, re.VERBOSE)
+# Same, references qualified with a sheet name are matched as a whole
+_LOCAL_REF_RE = re.compile(r"""
+      (?P<qualified>![$A-Za-z\d]+(?::[$A-Za-z\d]+)?)
+    | """ + _RELATIVE_REF_PATTERN, re.VERBOSE)
+
+_MAX_COLUMN = 18278  # ZZZ, the largest column openpyxl accepts
+
+
+class _CannotShift(Exception):
+    pass
+
+
+class FormulaShifter:
+    """
+    Move the relative references of formulas by a constant offset, as
+    copying the cells ``rows`` down and ``cols`` right would.
+
+    Drop-in replacement for ``openpyxl.formula.translate.Translator`` when
+    the offset is the same for every cell: references are shifted with
+    integer arithmetic, ``$`` anchored parts are kept, cell ranges, whole
+    column (``A:C``) and whole row (``2:5``) ranges are supported, string
+    literals and quoted sheet names are left alone. Formulas using
+    constructs it does not parse (structured ``[...]`` references) or
+    references moved out of the sheet are handed to ``Translator``, which
+    raises ``TranslatorError`` for the latter.
+
+    With ``local_only``, references qualified with a sheet name are kept:
+    the cells moved within their sheet, the other sheets did not (the
+    ``Translator`` fallback still shifts them).
+    """
+
+    def __init__(self, rows=0, cols=0, local_only=False):
+        self.rows = rows
+        self.cols = cols
+        self.local_only = local_only
+
+    def shift(self, formula):
+        if not formula or not isinstance(formula, str) or not formula.startswith('='):
+            return formula
+        pattern = _LOCAL_REF_RE if self.local_only else _RELATIVE_REF_RE
+        try:
+            return '=' + pattern.sub(self._replace, formula[1:])
+        except _CannotShift:
+            pass
+        from openpyxl.formula.translate import Translator
+        return Translator(formula, origin='A1').translate_formula(
+            row_delta=self.rows, col_delta=self.cols)
+
+    def _replace(self, match):
+        if self.local_only and match.group('qualified'):
+            return match.group(0)
+        if match.group('col'):
+            return self._shift_col(match.group('col')) + self._shift_row(match.group('row'))
+        if match.group('string') or match.group('sheet'):
+            return match.group(0)
+        if match.group('col1'):
+            return f"{self._shift_col(match.group('col1'))}:{self._shift_col(match.group('col2'))}"
+        if match.group('row1'):
+            return f"{self._shift_row(match.group('row1'))}:{self._shift_row(match.group('row2'))}"
+        raise _CannotShift()
+
+    def _shift_row(self, row):
+        if row[0] == '$':
+            return row
+        row = int(row) + self.rows
+        if row <= 0:
+            raise _CannotShift()
+        return str(row)
+
+    def _shift_col(self, col):
+        if col[0] == '$':
+            return col
+        index = 0
+        for char in col.upper():
+            index = index * 26 + ord(char) - 64
+        index += self.cols
+        if not 0 < index <= _MAX_COLUMN:
+            raise _CannotShift()
+        letters = ''
+        while index:
+            index, rest = divmod(index - 1, 26)
+            letters = chr(65 + rest) + letters
+        return letters
@@ -0,0 +1,51 @@
+# -*- coding: utf-8 -*-
+"""
+Row reader for the single-record lists of the calculator spreadsheets.
+"""
+
+
+def read_list_rows(records, requests, attributes_field=None):
+    """
+    Read the rows of many single-record lists in one pass.
+
+    The columns of all the requests are merged into one read plan: the
+    records are browsed together, so stored fields are fetched in one query
+    per table, and the display names of each relational column are computed
+    once for all records. Columns that are not fields of the model are
+    taken from ``attributes_field``.
+
+    :param records: recordset of the listed model (its content is ignored)
+    :param requests: iterable of ``(record id, field names)``
+    :param attributes_field: name of the JSON field holding the values of
+        dynamic columns (e.g. ``attributes_json``); without it they are empty
+    :return: {record id: row}, records that no longer exist are left out
+    """
+    columns_by_id = {}
+    for record_id, field_names in requests:
+        columns = columns_by_id.setdefault(record_id, {})
+        columns.update(dict.fromkeys(field_names or []))
+    if not columns_by_id:
+        return {}
+
+    records = records.browse(list(columns_by_id)).exists()
+    model_fields = records._fields
+    plan = {field for columns in columns_by_id.values() for field in columns if field in model_fields}
+    for field in plan:
+        if model_fields[field].relational:
+            records.mapped(field).mapped('display_name')
+
+    rows = {}
+    for record in records:
+        attrs = (record[attributes_field] or {}) if attributes_field else {}
+        row = {"id": record.id}
+        for field in columns_by_id[record.id]:
+            if field in plan:
+                val = record[field]
+                if hasattr(val, "display_name"):
+                    row[field] = val.display_name if len(val) <= 1 else ", ".join(val.mapped('display_name'))
+                else:
+                    row[field] = val
+            else:
+                row[field] = attrs.get(field, "")
+        rows[record.id] = row
+    return rows
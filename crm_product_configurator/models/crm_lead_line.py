@@ -246,41 +246,3 @@ class CrmMaterialLine(models.Model):
             for attribute in line.product_custom_attribute_value_ids:
                 if attribute.custom_product_template_attribute_value_id not in valid_values:
                     line.product_custom_attribute_value_ids -= attribute
-    
-    @api.model
-    def get_list_data(self, list_id, field_names):
-        """
-        Override to provide data including dynamic attributes from attributes_json
-        """
-        _logger.info(f"🟢 get_list_data called: list_id={list_id}, fields={field_names}")
-        
-        try:
-            line_id = int(list_id)
-        except (ValueError, TypeError):
-            _logger.error("Invalid list_id: %s", list_id)
-            return []
-
-        line = self.browse(line_id)
-        if not line.exists():
-            _logger.warning("Line %s not found", line_id)
-            return []
-
-        row = {"id": line.id}
-
-        for field in field_names:
-            if field in self._fields:
-                # Standard field
-                val = line[field]
-                if hasattr(val, "display_name"):
-                    row[field] = val.display_name
-                else:
-                    row[field] = val
-                _logger.info(f"✅ Standard field '{field}' = '{row[field]}'")
-            else:
-                # Dynamic attribute from attributes_json
-                attrs = line.attributes_json or {}
-                row[field] = attrs.get(field, "")
-                _logger.info(f"🔵 Dynamic field '{field}' = '{row[field]}' from attributes_json")
-
-        _logger.info(f"🟢 Final row data: {row}")
-        return [row]
\ No newline at end of file
@@ -5,7 +5,7 @@
     'author': "Entrivis Tech",
     'website': "https://www.entrivistech.com",
     'category': 'CRM',
-    'version': '18.0.1.0.5',
+    'version': '18.0.1.0.7',
     'depends': [
         'base',
         'crm_customisation',
@@ -16,6 +16,7 @@
     'data': [
         'security/ir.model.access.csv',
         'security/crm_spreadsheet_security.xml',
+        'data/spreadsheet_compaction_cron.xml',
         'views/crm_lead_views.xml',
         'views/res_config_settings_view.xml',
         'views/crm_quatation_template_view.xml',
@@ -24,6 +25,9 @@
         'views/product_category_view.xml',
 
     ],
+    'external_dependencies': {
+        'python': ['openpyxl'],
+    },
     'images': ['/static/description/icon.png'],
     'assets': {
         'spreadsheet.o_spreadsheet': [
@@ -0,0 +1,22 @@
+# -*- coding: utf-8 -*-
+import logging
+
+from odoo import api, SUPERUSER_ID
+from odoo.tools import split_every
+
+from odoo.addons.crm_spreadsheet_enhancement.models.sale_spreadsheet import SALES_FORMAT_VERSION
+
+_logger = logging.getLogger(__name__)
+
+
+def migrate(cr, version):
+    """Convert the sales spreadsheets stored before their format was versioned."""
+    env = api.Environment(cr, SUPERUSER_ID, {})
+    Spreadsheet = env['sale.order.spreadsheet']
+    spreadsheet_ids = Spreadsheet.search([('spreadsheet_format_version', '<', SALES_FORMAT_VERSION)]).ids
+    # batches keep a bounded amount of multi-megabyte data in the cache
+    for batch_ids in split_every(100, spreadsheet_ids):
+        Spreadsheet.browse(batch_ids)._upgrade_spreadsheet_format()
+        env.flush_all()
+        env.invalidate_all()
+    _logger.info(f"✅ Upgraded {len(spreadsheet_ids)} sales spreadsheets to format {SALES_FORMAT_VERSION}")
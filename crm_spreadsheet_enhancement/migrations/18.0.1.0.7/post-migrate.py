@@ -0,0 +1,18 @@
+# -*- coding: utf-8 -*-
+import logging
+
+_logger = logging.getLogger(__name__)
+
+
+def migrate(cr, version):
+    """
+    Index the consolidated calculators again from their revisions: the
+    registry now tracks their consolidated sheet as well.
+    """
+    cr.execute("""
+        UPDATE crm_lead_spreadsheet
+           SET aux_sheet_registry_ready = FALSE
+         WHERE calculator_layout = 'consolidated'
+           AND aux_sheet_registry_ready
+    """)
+    _logger.info(f"✅ {cr.rowcount} consolidated calculators reindexed on next sync")
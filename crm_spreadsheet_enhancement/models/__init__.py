@@ -2,7 +2,9 @@
 
 from . import crm_lead
 from . import crm_quatation_template
+from . import spreadsheet_compaction
 from . import crm_quote_spreadsheet
+from . import crm_reference_sheet
 from . import res_config_settings
 from . import sale_spreadsheet
 from . import product_category
\ No newline at end of file
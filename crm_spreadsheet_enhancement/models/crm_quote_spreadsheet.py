@@ -1,5 +1,5 @@
 # -*- coding: utf-8 -*-
-from odoo import api, fields, models, _
+from odoo import api, fields, models, tools, _
 import json
 import logging
 import re
@@ -9,7 +9,7 @@ import openpyxl
 from openpyxl.utils import get_column_letter, column_index_from_string
 from openpyxl.utils import get_column_letter, column_index_from_string
 from openpyxl.utils.cell import range_boundaries
-from openpyxl.formula.translate import Translator
+from odoo.addons.crm_customisation.tools.formula import FormulaRewriter, FormulaShifter
 import logging
 _logger = logging.getLogger(__name__)
 
@@ -24,10 +24,32 @@ CRM_MATERIAL_LINE_BASE_FIELDS = [
     'price_subtotal',        # Subtotal
 ]
 
+# Bump whenever _compile_template_plan output changes so stored plans are
+# recompiled from spreadsheet_data on next use.
+TEMPLATE_PLAN_VERSION = 3
+# Placeholders compiled into template plans; substituted per material line.
+PLAN_SHEET_ID = '__plan_sheet__'
+PLAN_MAIN_SHEET_NAME = '\x00main_sheet\x00'
+# Spreadsheet data key of the {material line id: {'sheetId', 'listId'}} index.
+LINE_INDEX_KEY = 'crmLineIndex'
+# 'snapshot': new calculators store their populated state as data;
+# 'revisions': they get one insert revision replayed by clients.
+CREATION_MODE_PARAM = 'crm_spreadsheet_enhancement.calculator_creation_mode'
+# Layout of new calculators: 'per_line' (one sheet and list per material
+# line) or 'consolidated' (one sheet and list, one row band per line).
+LAYOUT_PARAM = 'crm_spreadsheet_enhancement.calculator_layout'
+CONSOLIDATED_SHEET_ID = 'crm_lines'
+CONSOLIDATED_SHEET_NAME = 'Material Lines'
+# Lead list of the consolidated sheets created before each band got the
+# list of its line, replaced on their next sync
+CONSOLIDATED_LIST_ID = 'crm_lines'
+# Empty rows between two bands of the consolidated sheet
+BAND_GAP = 2
+
 
 class CrmLeadSpreadsheet(models.Model):
     _name = 'crm.lead.spreadsheet'
-    _inherit = 'spreadsheet.mixin'
+    _inherit = 'crm.spreadsheet.compaction.mixin'
     _description = 'CRM Quotation Spreadsheet'
 
     name = fields.Char(required=True)
@@ -35,6 +57,21 @@ class CrmLeadSpreadsheet(models.Model):
     sale_id = fields.Many2one('sale.order', string="Sale Order", ondelete='set null')
     company_id = fields.Many2one('res.company', default=lambda self: self.env.company)
     raw_spreadsheet_data = fields.Text("Raw Spreadsheet Data")
+    aux_sheet_registry_ids = fields.One2many(
+        'crm.lead.spreadsheet.aux.sheet', 'spreadsheet_id',
+        string="Auxiliary Sheets", copy=False,
+    )
+    aux_sheet_registry_ready = fields.Boolean(copy=False)
+    # Served with the session, never stored in the data or the revisions
+    reference_sheet_ids = fields.Many2many('crm.reference.sheet', string="Reference Sheets")
+    calculator_layout = fields.Selection(
+        [('per_line', 'One Sheet per Line'), ('consolidated', 'Single Sheet')],
+        string="Layout",
+        required=True,
+        default=lambda self: self.env['ir.config_parameter'].sudo().get_param(LAYOUT_PARAM, 'per_line'),
+    )
+    # Consolidated layout: {line id: {'top', 'height', 'width', 'columns', 'listId'}}
+    line_band_layout = fields.Text("Line Bands")
 
     # ------------------------------------------------------------------
     # ✅ CRITICAL: Override get_list_data (PUBLIC METHOD)
@@ -53,41 +90,7 @@ class CrmLeadSpreadsheet(models.Model):
             _logger.info(f"⚪ Not CRM model, using super: {model}")
             return super().get_list_data(model, list_id, field_names)
 
-        try:
-            line_id = int(list_id)
-        except (ValueError, TypeError):
-            _logger.error(f"❌ Invalid list_id: {list_id}")
-            return []
-
-        line = self.env['crm.material.line'].browse(line_id)
-        if not line.exists():
-            _logger.warning(f"❌ Material line {line_id} not found")
-            return []
-
-        _logger.info(f"✅ Found line {line_id}: {line.product_template_id.display_name}")
-
-        # Get attributes_json FIRST
-        attrs = line.attributes_json or {}
-        _logger.info(f"📦 attributes_json: {attrs}")
-
-        row = {"id": line.id}
-
-        for field in field_names:
-            if field in line._fields:
-                # Standard Odoo field
-                val = line[field]
-                if hasattr(val, "display_name"):
-                    row[field] = val.display_name
-                else:
-                    row[field] = val
-                _logger.info(f"✅ Standard field '{field}' = '{row[field]}'")
-            else:
-                # Dynamic attribute from attributes_json
-                row[field] = attrs.get(field, "")
-                _logger.info(f"🔵 Dynamic field '{field}' = '{row[field]}'")
-
-        _logger.info(f"🟡 Final row data: {row}")
-        return [row]
+        return self.env['crm.material.line'].get_list_data(list_id, field_names)
 
     # ------------------------------------------------------------------
     # ✅ INTERNAL: _get_list_data (PRIVATE METHOD)
@@ -143,12 +146,16 @@ class CrmLeadSpreadsheet(models.Model):
     @api.model_create_multi
     def create(self, vals_list):
         records = super().create(vals_list)
-        for rec in records:
+        snapshot_mode = self.env['ir.config_parameter'].sudo().get_param(
+            CREATION_MODE_PARAM, 'snapshot'
+        ) == 'snapshot'
+        for rec, vals in zip(records, vals_list):
             if rec.lead_id and rec.lead_id.material_line_ids:
-                for line in rec.lead_id.material_line_ids:
-                    rec.with_context(
-                        material_line_id=line.id
-                    )._dispatch_insert_list_revision()
+                # Keep explicitly provided data: insert on top of it
+                has_data = 'spreadsheet_data' in vals or 'spreadsheet_binary_data' in vals
+                if snapshot_mode and not has_data and rec._write_initial_snapshot():
+                    continue
+                rec._dispatch_insert_list_revisions(rec.lead_id.material_line_ids)
         return records
 
     # ------------------------------------------------------------------
@@ -171,39 +178,60 @@ class CrmLeadSpreadsheet(models.Model):
         sheets = spreadsheet_json.get('sheets') or []
 
         current_line_ids = set(self.lead_id.material_line_ids.ids) if self.lead_id else set()
-        existing_list_ids = {int(list_id) for list_id in lists.keys() if list_id.isdigit()}
+        line_index = self._get_line_sheet_index(spreadsheet_json)
 
-        missing_ids = current_line_ids - existing_list_ids
-        removed_ids = existing_list_ids - current_line_ids
+        if self.calculator_layout == 'consolidated':
+            # Lines are bands of one sheet, kept in sync by the revisions
+            missing_ids = removed_ids = set()
+            current_line_ids = set(line_index)
+        else:
+            missing_ids = current_line_ids - set(line_index)
+            removed_ids = set(line_index) - current_line_ids
 
         # Add sheets
         for line_id in missing_ids:
             new_sheet = self._create_sheet_for_material_line(line_id)
             lists[str(line_id)] = new_sheet['list']
             sheets.append(new_sheet['sheet'])
+            if new_sheet['sheet']:
+                line_index[line_id] = {'sheetId': new_sheet['sheet']['id'], 'listId': str(line_id)}
+
+        # Re-register lists of line sheets that lost theirs
+        for line_id in current_line_ids - missing_ids:
+            list_id = line_index[line_id]['listId']
+            if list_id not in lists:
+                lists[list_id] = self._create_sheet_for_material_line(line_id)['list']
 
         # Remove sheets
         if removed_ids:
+            removed_sheet_ids = set()
             for rid in removed_ids:
-                if str(rid) in lists:
-                    del lists[str(rid)]
-            sheets = [
-                s for s in sheets
-                if not any(str(rid) in json.dumps(s) for rid in removed_ids)
-            ]
+                entry = line_index.pop(rid)
+                lists.pop(entry['listId'], None)
+                removed_sheet_ids.add(entry['sheetId'])
+            sheets = [s for s in sheets if s.get('id') not in removed_sheet_ids]
+
+        # Reference sheets of the templates, shared by every calculator
+        sheet_ids = {sheet.get('id') for sheet in sheets}
+        for reference in self.reference_sheet_ids:
+            if reference.sheet_key not in sheet_ids:
+                sheets.append(reference._get_sheet())
 
         spreadsheet_json['lists'] = lists
         spreadsheet_json['sheets'] = sheets
+        self._set_line_sheet_index(spreadsheet_json, line_index)
 
         # 🎯 REORDER SHEETS: Main sheets first, then auxiliary sheets
-        # Main sheets have IDs like "sheet_123" (material line sheets)
+        # Main sheets are the material line sheets of the index
         # Auxiliary sheets have IDs like "profile_master", "resin", "helper"
+        line_sheet_ids = {entry['sheetId'] for entry in line_index.values()}
+        if self.calculator_layout == 'consolidated':
+            line_sheet_ids.add(CONSOLIDATED_SHEET_ID)
         main_sheets = []
         auxiliary_sheets = []
         
         for sheet in sheets:
-            sheet_id = sheet.get('id', '')
-            if sheet_id.startswith('sheet_'):
+            if sheet.get('id') in line_sheet_ids:
                 # This is a main material line sheet
                 main_sheets.append(sheet)
             else:
@@ -211,17 +239,7 @@ class CrmLeadSpreadsheet(models.Model):
                 auxiliary_sheets.append(sheet)
         
         # Sort auxiliary sheets by priority
-        def sheet_order(s):
-            name = (s.get('name') or "").lower()
-            if "profile master" in name or "profile" in name:
-                return 1
-            if "resin" in name:
-                return 2
-            if "helper" in name:
-                return 3
-            return 99
-        
-        auxiliary_sheets.sort(key=sheet_order)
+        auxiliary_sheets.sort(key=self._aux_sheet_order)
         
         # Rebuild sheets array in correct order
         spreadsheet_json['sheets'] = main_sheets + auxiliary_sheets
@@ -232,24 +250,51 @@ class CrmLeadSpreadsheet(models.Model):
             _logger.info(f"📌 Active sheet set to: {first_main_sheet_id}")
             _logger.info(f"📊 Sheet order: {[s.get('name') for s in spreadsheet_json['sheets']]}")
 
-        # ✅ Preload data for ALL lists
-        _logger.info("🔥 Preloading data for all lists...")
-        for list_id, list_config in lists.items():
-            try:
-                line_id = int(list_id)
-                line = self.env['crm.material.line'].browse(line_id)
-                if line.exists():
-                    columns = list_config.get('columns', [])
-                    list_data = self.get_list_data('crm.material.line', list_id, columns)
-                    _logger.info(f"✅ Preloaded list {list_id}: {list_data}")
-            except Exception as e:
-                _logger.error(f"❌ Failed to preload list {list_id}: {e}")
-
         data['data'] = spreadsheet_json
-        self.raw_spreadsheet_data = json.dumps(spreadsheet_json)
+        self.raw_spreadsheet_data = json.dumps(self._strip_reference_sheets(spreadsheet_json))
 
         return data
 
+    # ------------------------------------------------------------------
+    # HELPER: Material line → sheet index
+    # ------------------------------------------------------------------
+    @api.model
+    def _get_line_sheet_index(self, spreadsheet_json):
+        """
+        Return the {material line id: {'sheetId', 'listId'}} index of a
+        spreadsheet.
+
+        The index is stored under ``LINE_INDEX_KEY`` in the spreadsheet
+        data, but the registered lists (list id = line id) and ``sheet_<id>``
+        sheets stay the source of truth since the client drops unknown keys
+        when it snapshots: the stored entries only complete them. One pass
+        over the lists and sheets, no serialization.
+        """
+        stored = spreadsheet_json.get(LINE_INDEX_KEY) or {}
+        sheet_ids = [sheet.get('id') or '' for sheet in spreadsheet_json.get('sheets') or []]
+        existing_sheet_ids = set(sheet_ids)
+        index = {}
+        for list_id, list_config in (spreadsheet_json.get('lists') or {}).items():
+            if not str(list_id).isdigit():
+                continue
+            candidates = [
+                (stored.get(str(list_id)) or {}).get('sheetId'),
+                list_config.get('sheetId'),
+            ]
+            index[int(list_id)] = {
+                'sheetId': next((sid for sid in candidates if sid in existing_sheet_ids), f"sheet_{list_id}"),
+                'listId': str(list_id),
+            }
+        for sheet_id in sheet_ids:
+            line_id = sheet_id[len('sheet_'):]
+            if sheet_id.startswith('sheet_') and line_id.isdigit() and int(line_id) not in index:
+                index[int(line_id)] = {'sheetId': sheet_id, 'listId': line_id}
+        return index
+
+    @api.model
+    def _set_line_sheet_index(self, spreadsheet_json, index):
+        spreadsheet_json[LINE_INDEX_KEY] = {str(line_id): entry for line_id, entry in index.items()}
+
     # ------------------------------------------------------------------
     # HELPER: Get Columns
     # ------------------------------------------------------------------
@@ -258,11 +303,22 @@ class CrmLeadSpreadsheet(models.Model):
         Helper to construct columns for a material line sheet.
         Returns base fields + dynamic attributes (excluding duplicates).
         """
+        template = line.product_template_id
+        dynamic_keys = line.attributes_json.keys() if isinstance(line.attributes_json, dict) else ()
+        return list(self._get_column_layout(
+            tuple(ptal.attribute_id.name for ptal in template.attribute_line_ids),
+            tuple(sorted(dynamic_keys)),
+        ))
+
+    @tools.ormcache('attribute_names', 'dynamic_keys')
+    def _get_column_layout(self, attribute_names, dynamic_keys):
+        # Memoized per attribute names, in attribute line order, and
+        # attributes_json key set: renaming an attribute or changing the
+        # attribute lines of a template changes the key, nothing to clear
         # 1. Start with base fields
         columns = list(CRM_MATERIAL_LINE_BASE_FIELDS)
         
-        # 2. Get dynamic attributes from attributes_json
-        dynamic_keys = list(line.attributes_json.keys()) if isinstance(line.attributes_json, dict) else []
+        # 2. Dynamic attributes are the sorted keys of attributes_json
         
         # 3. Create a mapping of field names to their common variations
         # This helps filter out attributes that duplicate base fields
@@ -287,16 +343,13 @@ class CrmLeadSpreadsheet(models.Model):
         
         # 4. Priority ordering for product-specific attributes
         priority = []
-        template = line.product_template_id
-        if template:
-            for ptal in template.attribute_line_ids:
-                attr_name = ptal.attribute_id.name
-                if attr_name in filtered_dynamic:
-                    priority.append(attr_name)
-                # Also check for UOM variants (e.g., "Width UOM")
-                uom_name = f"{attr_name} UOM"
-                if uom_name in filtered_dynamic:
-                    priority.append(uom_name)
+        for attr_name in attribute_names:
+            if attr_name in filtered_dynamic:
+                priority.append(attr_name)
+            # Also check for UOM variants (e.g., "Width UOM")
+            uom_name = f"{attr_name} UOM"
+            if uom_name in filtered_dynamic:
+                priority.append(uom_name)
         
         # 5. Build ordered list of dynamic attributes
         ordered_dynamic = []
@@ -314,7 +367,7 @@ class CrmLeadSpreadsheet(models.Model):
         # 6. Combine base fields + ordered dynamic attributes
         columns.extend(ordered_dynamic)
         
-        return columns
+        return tuple(columns)
 
     # ------------------------------------------------------------------
     # EMPTY DATA (initial load)
@@ -326,10 +379,15 @@ class CrmLeadSpreadsheet(models.Model):
 
         if not self.lead_id or not self.lead_id.material_line_ids:
             return data
+        if self.calculator_layout == 'consolidated':
+            # The bands are written by the insert revision or snapshot
+            return data
 
         # 🔄 NEW: Collect all sheets first, then reorder
         main_sheets = []
         auxiliary_sheets = []
+        # Reference sheets linked at creation are served with the session
+        auxiliary_sheet_ids = set(self.reference_sheet_ids.mapped('sheet_key'))
         
         for line in self.lead_id.material_line_ids:
             sheet_id = f"sheet_{line.id}"
@@ -338,47 +396,19 @@ class CrmLeadSpreadsheet(models.Model):
 
             columns = self._get_material_line_columns(line)
 
-            # Check for template
-            template_data = None
-            if line.product_template_id.categ_id.spreadsheet_data:
-                try:
-                    template_data = json.loads(line.product_template_id.categ_id.spreadsheet_data)
-                except Exception:
-                    pass
+            # Sanitized template sheets, shared by every line of the category
+            template_sheets = line.product_template_id.categ_id._get_template_sheets()
 
-            if template_data and template_data.get('sheets'):
-                # 1. Main Sheet (Index 0)
-                template_sheet = template_data['sheets'][0]
-                # We need to deep copy to avoid modifying the cached template
-                import copy
-                sheet_json = copy.deepcopy(template_sheet)
-                sheet_json['id'] = sheet_id
-                sheet_json['name'] = product_name
-                
-                # ✅ SANITIZE: Ensure all cell content is string AND remove invalid format
-                if 'cells' in sheet_json:
-                    for cell_key, cell_val in sheet_json['cells'].items():
-                        if 'content' in cell_val:
-                            cell_val['content'] = str(cell_val['content']) if cell_val['content'] is not None else ""
-                        if 'format' in cell_val:
-                            del cell_val['format']
-                            
-                main_sheets.append(sheet_json)
+            if template_sheets:
+                # 1. Main Sheet (Index 0): only its id and name are its own
+                main_sheets.append(dict(template_sheets[0], id=sheet_id, name=product_name))
 
                 # 2. Auxiliary Sheets (Index 1+) - Collect for sorting
-                for aux_sheet in template_data['sheets'][1:]:
+                for aux_sheet in template_sheets[1:]:
                     # Check if sheet with this ID already exists
-                    existing_ids = {s.get('id') for s in auxiliary_sheets}
-                    if aux_sheet.get('id') not in existing_ids:
-                        aux_copy = copy.deepcopy(aux_sheet)
-                        # Sanitize
-                        if 'cells' in aux_copy:
-                            for cell_key, cell_val in aux_copy['cells'].items():
-                                if 'content' in cell_val:
-                                    cell_val['content'] = str(cell_val['content']) if cell_val['content'] is not None else ""
-                                if 'format' in cell_val:
-                                    del cell_val['format']
-                        auxiliary_sheets.append(aux_copy)
+                    if aux_sheet.get('id') not in auxiliary_sheet_ids:
+                        auxiliary_sheet_ids.add(aux_sheet.get('id'))
+                        auxiliary_sheets.append(aux_sheet)
             else:
                 # Default behavior
                 main_sheets.append({'id': sheet_id, 'name': product_name})
@@ -397,107 +427,43 @@ class CrmLeadSpreadsheet(models.Model):
                 },
             }
 
-        # 🎯 SORT auxiliary sheets: Profile Master → Resin → Helper
-        def sheet_order(s):
-            name = (s.get('name') or "").lower()
-            if "profile master" in name or "profile" in name:
-                return 1
-            if "resin" in name:
-                return 2
-            if "helper" in name:
-                return 3
-            return 99
-
-        auxiliary_sheets.sort(key=sheet_order)
+        # 🎯 SORT auxiliary sheets: same order as join_spreadsheet_session
+        auxiliary_sheets.sort(key=self._aux_sheet_order)
 
         # ✅ Append in correct order: Main sheets first, then sorted auxiliaries
         data['sheets'].extend(main_sheets)
         data['sheets'].extend(auxiliary_sheets)
+        self._set_line_sheet_index(data, self._get_line_sheet_index(data))
 
         return data
     
-    def _shift_formula_rows(self, content, sheet_name, offset):
-        if offset == 0 or not sheet_name:
-            return content
-        
-        escaped_name = re.escape(sheet_name)
-        # Match 'Sheet Name'!Ref or SheetName!Ref
-        pattern = re.compile(f"(?:'({escaped_name})'|({escaped_name}))!(\\$?[A-Za-z]+)(\\$?)(\\d+)", re.IGNORECASE)
-        
-        def replace_func(match):
-            prefix = match.group(1) or match.group(2)
-            is_quoted = bool(match.group(1))
-            col_part = match.group(3)
-            row_anchor = match.group(4)
-            row_num = int(match.group(5))
-            new_row = row_num + offset
-            sheet_part = f"'{prefix}'" if is_quoted else prefix
-            return f"{sheet_part}!{col_part}{row_anchor}{new_row}"
-
-        return pattern.sub(replace_func, content)
-
-    def _fix_formula(self, content, original_name, new_name, all_sheet_names, main_sheet_info=None):
-        if not content or not isinstance(content, str) or not content.startswith('='):
-            return content
-        
-        # 0. Shift references to Main Sheet if needed
-        if main_sheet_info:
-            ms_name = main_sheet_info.get('name')
-            ms_offset = main_sheet_info.get('offset', 0)
-            if ms_name and ms_offset:
-                content = self._shift_formula_rows(content, ms_name, ms_offset)
-
-        # 1. Fix self-reference (rename current sheet in formulas)
-        if original_name and new_name and original_name != new_name:
-            # Replace 'Original Name'! with 'New Name'!
-            content = content.replace(f"'{original_name}'!", f"'{new_name}'!")
-            if ' ' not in original_name:
-                content = content.replace(f"{original_name}!", f"'{new_name}'!")
-        
-        # 1.5 Fix references to main sheet in auxiliary sheets
-        # When main "Costing" sheet is renamed to product name, update references
-        if main_sheet_info and main_sheet_info.get('name') and main_sheet_info.get('new_name'):
-            old_main = main_sheet_info['name']
-            new_main = main_sheet_info['new_name']
-            if old_main != new_main:
-                # Update both quoted and unquoted references
-                content = content.replace(f"'{old_main}'!", f"'{new_main}'!")
-                if ' ' not in old_main:
-                    # Use regex to avoid partial matches
-                    import re
-                    content = re.sub(
-                        f"\\b{re.escape(old_main)}!",
-                        f"'{new_main}'!",
-                        content
-                    )
-        
-        # 2. Ensure all sheet names in cross-sheet references are properly quoted
-        # This prevents #NAME? errors
-        if all_sheet_names:
-            for sheet_name in all_sheet_names:
-                if not sheet_name:
-                    continue
-                # If sheet name contains spaces or special chars, ensure it's quoted
-                if ' ' in sheet_name or '-' in sheet_name or '.' in sheet_name:
-                    # Replace unquoted sheet references with quoted ones
-                    # Pattern: SheetName! but not 'SheetName'!
-                    escaped_name = re.escape(sheet_name)
-                    # Look for unquoted references
-                    content = re.sub(
-                        f"(?<!')[\\b]{escaped_name}(?=!)",
-                        f"'{sheet_name}'",
-                        content
-                    )
-        
-        # 3. Ensure no double equals (prevents #BAD EXPR)
-        if content.startswith("=="):
-            content = content[1:]
-        
-        # 4. Fix common Excel → Odoo incompatibilities
-        # Remove extra quotes that might cause issues
-        content = content.replace("''", "'")
-            
-        return content
+    def _get_formula_rewriter(self, original_name, new_name, main_sheet_info=None):
+        """
+        Build the single-pass rewriter applying, to every formula of a sheet:
+        the sheet's own rename, the main sheet rename (Costing → product
+        name) and the row shift of references to the main sheet.
+        """
+        renames = {}
+        row_shifts = {}
+        if original_name and new_name:
+            renames[original_name] = new_name
+        if main_sheet_info and main_sheet_info.get('name'):
+            ms_name = main_sheet_info['name']
+            if main_sheet_info.get('new_name'):
+                renames[ms_name] = main_sheet_info['new_name']
+            if main_sheet_info.get('offset'):
+                row_shifts[ms_name] = main_sheet_info['offset']
+        return FormulaRewriter(sheet_renames=renames, row_shifts=row_shifts)
+
+    def _fix_formula(self, content, original_name, new_name, all_sheet_names=None, main_sheet_info=None):
+        """
+        Fix a template formula for its new sheet: renames, main sheet row
+        shift, sheet name quoting (prevents #NAME?) and ``==`` (prevents
+        #BAD EXPR). Prefer building one rewriter per sheet with
+        ``_get_formula_rewriter`` when fixing many formulas.
+        """
+        return self._get_formula_rewriter(original_name, new_name, main_sheet_info).rewrite(content)
+
     def _get_validation_rule(self, val, all_sheet_names):
         """
         Convert Excel dropdown formula into correct Odoo Spreadsheet dataValidation rule.
@@ -586,26 +552,34 @@ class CrmLeadSpreadsheet(models.Model):
             })
 
         # -----------------------------------------
-        # 🔥 STEP 1: Build dropdown validation map (Excel → Odoo conversion)
+        # 🔥 STEP 1: Convert dropdown validations (Excel → Odoo), one rule per
+        # template validation covering all of its (shifted) ranges
         # -----------------------------------------
-        cell_validations = {}
+        range_validations = []
         if 'validations' in sheet_json:
             _logger.info(f"🔍 Found {len(sheet_json['validations'])} validation rules in template")
             for val in sheet_json['validations']:
+                target_ranges = []
                 for rng in val.get('ranges', []):
                     try:
                         min_col, min_row, max_col, max_row = range_boundaries(rng)
-                        for r in range(min_row, max_row + 1):
-                            for c in range(min_col, max_col + 1):
-                                cell_validations[(r - 1, c - 1)] = self._get_validation_rule(val, all_sheet_names)
+                        start = f"{get_column_letter(min_col + col_offset)}{min_row + row_offset}"
+                        end = f"{get_column_letter(max_col + col_offset)}{max_row + row_offset}"
+                        target_ranges.append(start if start == end else f"{start}:{end}")
                     except Exception as e:
                         _logger.warning(f"⚠️ Failed to parse validation range {rng}: {e}")
+                if target_ranges:
+                    range_validations.append(
+                        (target_ranges, self._get_validation_rule(val, all_sheet_names))
+                    )
 
-        _logger.info(f"📋 Total cells with validation: {len(cell_validations)}")
+        _logger.info(f"📋 Total validation rules: {len(range_validations)}")
 
         # -----------------------------------------
         # 🔥 STEP 2: CELLS & FORMULAS (WITHOUT validation attached)
         # -----------------------------------------
+        rewriter = self._get_formula_rewriter(original_sheet_name_raw, new_sheet_name, main_sheet_info)
+        shifter = FormulaShifter(rows=row_offset, cols=col_offset)
         for cell_ref, cell_data in sheet_json.get('cells', {}).items():
             col_l = "".join(filter(str.isalpha, cell_ref))
             row_n = int("".join(filter(str.isdigit, cell_ref))) - 1
@@ -616,13 +590,10 @@ class CrmLeadSpreadsheet(models.Model):
             # 🔁 Relocate formulas to new shifted position
             if content.startswith('='):
                 try:
-                    origin = f"{col_l}{row_n + 1}"
-                    dest_col_letter = get_column_letter(col_n + col_offset + 1)
-                    dest_ref = f"{dest_col_letter}{row_n + row_offset + 1}"
-                    content = Translator(content, origin=origin).translate_formula(dest_ref)
+                    content = shifter.shift(content)
                 except:
                     pass
-                content = self._fix_formula(content, original_sheet_name_raw, new_sheet_name, all_sheet_names, main_sheet_info)
+                content = rewriter.rewrite(content)
 
             # ✅ Create cell command WITHOUT validation (clean separation)
             cmd = {
@@ -637,17 +608,12 @@ class CrmLeadSpreadsheet(models.Model):
         # -----------------------------------------
         # 🔥 STEP 3: Apply ALL validations as SEPARATE commands
         # -----------------------------------------
-        _logger.info(f"🎯 Applying {len(cell_validations)} validations as separate commands...")
+        _logger.info(f"🎯 Applying {len(range_validations)} validations as separate commands...")
         
         validation_commands = []
-        for (r, c), rule in cell_validations.items():
-            target_col = c + col_offset
-            target_row = r + row_offset
-            cell_range = f"{get_column_letter(target_col + 1)}{target_row + 1}"
-            
+        for target_ranges, rule in range_validations:
             # ✅ Build Odoo-compatible validation structure
             validation = None
-            dv_id = f"dv_{sheet_id}_{target_row}_{target_col}"
             
             if rule.get('range'):
                 # 🔥 Range-based dropdown (e.g., 'Profile Master'!A2:A1000)
@@ -664,7 +630,7 @@ class CrmLeadSpreadsheet(models.Model):
                     'values': [src],
                     'displayStyle': 'arrow'
                 }
-                _logger.info(f"✅ Range validation @ {cell_range}: {src}")
+                _logger.info(f"✅ Range validation @ {target_ranges}: {src}")
                 
             elif rule.get('values'):
                 # 🔥 Static list dropdown (e.g., ["A", "B", "C"])
@@ -673,18 +639,17 @@ class CrmLeadSpreadsheet(models.Model):
                     'values': rule['values'],
                     'displayStyle': 'arrow'
                 }
-                _logger.info(f"✅ List validation @ {cell_range}: {rule['values']}")
+                _logger.info(f"✅ List validation @ {target_ranges}: {rule['values']}")
             
             if validation:
                 # ✅ Generate unique ID for this rule
-               
                 dv_id = f"dv_{uuid.uuid4().hex[:8]}"
                 
                 # ✅ CORRECT ODOO FORMAT (matching base implementation)
                 validation_cmd = {
                     'type': 'ADD_DATA_VALIDATION_RULE',  # ← CORRECT command type
                     'sheetId': sheet_id,
-                    'ranges': [cell_range],  # ← ranges at top level
+                    'ranges': target_ranges,  # ← ranges at top level
                     'rule': {  # ← rule wrapper
                         'id': dv_id,  # ← id inside rule
                         'criterion': validation  # ← criterion inside rule
@@ -701,6 +666,186 @@ class CrmLeadSpreadsheet(models.Model):
 
 
 
+    # ------------------------------------------------------------------
+    # TEMPLATE COMMAND PLANS
+    # ------------------------------------------------------------------
+    @api.model
+    def _aux_sheet_order(self, sheet):
+        """Tab order of auxiliary sheets: Profile Master → Resin → Helper → Others."""
+        name = (sheet.get('name') or "").lower()
+        if "profile master" in name or "profile" in name:
+            return 1
+        if "resin" in name:
+            return 2
+        if "helper" in name:
+            return 3
+        return 99
+
+    @api.model
+    def _compile_template_plan(self, template_data):
+        """
+        Build the populate commands of a category template once, at ingest.
+
+        Formulas are translated and fixed, cells sanitized and validation
+        commands built here; the per-line sheet id and the product name the
+        main sheet is renamed to are left as placeholders
+        (``PLAN_SHEET_ID`` / ``PLAN_MAIN_SHEET_NAME``) for
+        ``_instantiate_plan_commands``.
+        """
+        sheets = (template_data or {}).get('sheets') or []
+        if not sheets:
+            return False
+
+        # Collect all sheet names for dynamic reference fixing
+        all_sheet_names = [s.get('name') for s in sheets]
+
+        main_sheet = sheets[0]
+        main_sheet_info = {
+            'name': main_sheet.get('name'),
+            'new_name': PLAN_MAIN_SHEET_NAME,
+            'offset': 4,
+        }
+        main_commands = self._get_sheet_populate_commands(
+            main_sheet,
+            PLAN_SHEET_ID,
+            row_offset=4,
+            new_sheet_name=PLAN_MAIN_SHEET_NAME,
+            all_sheet_names=all_sheet_names,
+            main_sheet_info=main_sheet_info,
+        )
+
+        aux = []
+        for aux_sheet in sorted(sheets[1:], key=self._aux_sheet_order):
+            aux.append({
+                'id': aux_sheet.get('id'),
+                'name': aux_sheet.get('name', 'Sheet')[:31],
+                'commands': self._get_sheet_populate_commands(
+                    aux_sheet,
+                    PLAN_SHEET_ID,
+                    row_offset=0,
+                    new_sheet_name=aux_sheet.get('name'),
+                    all_sheet_names=all_sheet_names,
+                    main_sheet_info=main_sheet_info,
+                ),
+            })
+
+        return {
+            'version': TEMPLATE_PLAN_VERSION,
+            'main': {'name': main_sheet.get('name'), 'commands': main_commands},
+            'aux': aux,
+        }
+
+    def _instantiate_plan_commands(self, plan_commands, sheet_id, main_sheet_name):
+        """
+        Copy compiled template commands onto a sheet. Plans are shared
+        (cached per template), so commands are shallow-copied, never mutated.
+        """
+        commands = []
+        for plan_cmd in plan_commands:
+            cmd = dict(plan_cmd, sheetId=sheet_id)
+            if cmd['type'] == 'UPDATE_CELL':
+                if PLAN_MAIN_SHEET_NAME in cmd['content']:
+                    # the placeholder is always compiled inside quotes
+                    cmd['content'] = cmd['content'].replace(
+                        PLAN_MAIN_SHEET_NAME, main_sheet_name.replace("'", "''")
+                    )
+            elif cmd['type'] == 'ADD_DATA_VALIDATION_RULE':
+                cmd['rule'] = dict(cmd['rule'], id=f"dv_{uuid.uuid4().hex[:8]}")
+            commands.append(cmd)
+        return commands
+
+    # ------------------------------------------------------------------
+    # AUXILIARY SHEET REGISTRY
+    # ------------------------------------------------------------------
+    def dispatch_spreadsheet_message(self, message, *args, **kwargs):
+        is_accepted = super().dispatch_spreadsheet_message(message, *args, **kwargs)
+        if is_accepted and message.get('type') == 'REMOTE_REVISION':
+            for spreadsheet in self.filtered('aux_sheet_registry_ready'):
+                spreadsheet._update_aux_sheet_registry(message.get('commands') or [])
+        return is_accepted
+
+    def _snapshot_spreadsheet(self, revision_uuid, snapshot_revision_uuid, spreadsheet_snapshot):
+        # Reference sheets are served with the session: keep them out of the snapshot
+        return super()._snapshot_spreadsheet(
+            revision_uuid, snapshot_revision_uuid, self._strip_reference_sheets(spreadsheet_snapshot)
+        )
+
+    def _strip_reference_sheets(self, spreadsheet_json):
+        """Copy of spreadsheet data without the sheets served with the session."""
+        reference_keys = set(self.reference_sheet_ids.mapped('sheet_key'))
+        if not reference_keys:
+            return spreadsheet_json
+        return dict(spreadsheet_json, sheets=[
+            sheet for sheet in spreadsheet_json.get('sheets') or []
+            if sheet.get('id') not in reference_keys
+        ])
+
+    def _delete_collaborative_data(self):
+        super()._delete_collaborative_data()
+        self.aux_sheet_registry_ids.unlink()
+        self.aux_sheet_registry_ready = False
+        self.reference_sheet_ids = False
+
+    def _get_aux_sheet_ids(self):
+        """
+        Ids of the auxiliary sheets materialized by the revisions of this
+        spreadsheet, and of the consolidated sheet: in revision mode it
+        only exists in the revisions until they are snapshotted.
+
+        Kept in ``crm.lead.spreadsheet.aux.sheet`` as revisions are accepted
+        (server and client side both go through
+        ``dispatch_spreadsheet_message``); spreadsheets that predate the
+        registry are indexed once from their revision history.
+        """
+        self.ensure_one()
+        if not self.aux_sheet_registry_ready:
+            revisions = self.env['spreadsheet.revision'].search([
+                ('res_id', '=', self.id),
+                ('res_model', '=', self._name),
+            ], order='id')
+            for revision in revisions:
+                try:
+                    commands = json.loads(revision.commands).get('commands') or []
+                except (TypeError, ValueError, AttributeError):
+                    continue
+                self._update_aux_sheet_registry(commands)
+            self.aux_sheet_registry_ready = True
+        return set(self.aux_sheet_registry_ids.mapped('sheet_id'))
+
+    def _compact_revisions(self):
+        # Index the aux sheets of the revisions before they are folded
+        self._get_aux_sheet_ids()
+        return super()._compact_revisions()
+
+    def _update_aux_sheet_registry(self, commands):
+        self.ensure_one()
+        registered = set(self.aux_sheet_registry_ids.mapped('sheet_id'))
+        created, deleted = set(), set()
+        for cmd in commands:
+            sheet_id = cmd.get('sheetId')
+            # Line sheets are tracked by their lists, not the consolidated one
+            if not sheet_id or (sheet_id != CONSOLIDATED_SHEET_ID and self._is_line_sheet_id(sheet_id)):
+                continue
+            if cmd.get('type') == 'CREATE_SHEET':
+                created.add(sheet_id)
+                deleted.discard(sheet_id)
+            elif cmd.get('type') == 'DELETE_SHEET':
+                deleted.add(sheet_id)
+                created.discard(sheet_id)
+        if created - registered:
+            self.env['crm.lead.spreadsheet.aux.sheet'].create([
+                {'spreadsheet_id': self.id, 'sheet_id': sheet_id}
+                for sheet_id in created - registered
+            ])
+        if deleted & registered:
+            self.aux_sheet_registry_ids.filtered(lambda r: r.sheet_id in deleted).unlink()
+
+    @api.model
+    def _is_line_sheet_id(self, sheet_id):
+        if sheet_id == CONSOLIDATED_SHEET_ID:
+            return True
+        return sheet_id.startswith('sheet_') and sheet_id[len('sheet_'):].isdigit()
+
     # ------------------------------------------------------------------
     # INSERT REVISION (create new sheet on new line)
     # ------------------------------------------------------------------
@@ -710,54 +855,96 @@ class CrmLeadSpreadsheet(models.Model):
         line_id = self._context.get('material_line_id')
         if not line_id:
             return
-        
-        commands = []
-        line = self.env['crm.material.line'].browse(line_id)
-        if not line.exists():
+        self._dispatch_insert_list_revisions(self.env['crm.material.line'].browse(line_id))
+
+    def _dispatch_insert_list_revisions(self, lines):
+        """
+        Create the sheets of several material lines in a single revision.
+
+        The spreadsheet data and the auxiliary sheet registry are read once
+        and the commands of every line are concatenated. The commands and
+        their order are the same as one revision per line, but clients
+        replay one revision instead of one per line.
+        """
+        self.ensure_one()
+        lines = lines.exists()
+        if not lines:
             return
 
-        sheet_id = f"sheet_{line.id}"
-        list_id = str(line.id)
-        product_name = (line.product_template_id.display_name or "Item")[:31]
+        current_data = json.loads(self.raw_spreadsheet_data) if self.raw_spreadsheet_data else {}
+        current_sheet_ids = {s.get('id') for s in current_data.get('sheets', [])}
+        current_sheet_ids |= self._get_aux_sheet_ids()
 
-        columns = self._get_material_line_columns(line)
+        self._link_reference_sheets(lines, current_sheet_ids)
+        commands = self._get_lines_insert_commands(lines, current_sheet_ids)
 
-        _logger.info(f"🔧 Creating sheet for line {line_id} with columns: {columns}")
+        _logger.info(f"📤 Dispatching {len(commands)} commands for {len(lines)} sheets")
+        self._dispatch_commands(commands)
 
-        # Build column metadata with proper types
-        columns_meta = []
-        for col in columns:
-            if col in self.env['crm.material.line']._fields:
-                ftype = self.env['crm.material.line']._fields[col].type
-            else:
-                # Dynamic attribute - treat as char
-                ftype = 'char'
-            columns_meta.append({'name': col, 'type': ftype})
+    def _link_reference_sheets(self, lines, current_sheet_ids):
+        """
+        Link the reference sheets of the templates of ``lines`` the
+        spreadsheet has no sheet of the same id for (``current_sheet_ids``),
+        before their insert commands are built: they are served with the
+        session instead of being created by the commands.
+        """
+        references = self._get_reference_sheets_to_link(lines, current_sheet_ids)
+        if references:
+            self.reference_sheet_ids |= references
+
+    def _get_reference_sheets_to_link(self, lines, current_sheet_ids):
+        references = self.env['crm.reference.sheet']
+        sheet_keys = set(current_sheet_ids) | set(self.reference_sheet_ids.mapped('sheet_key'))
+        for category_sheets in self._get_reference_sheets_by_category(lines).values():
+            for sheet_key, reference in category_sheets.items():
+                if sheet_key not in sheet_keys:
+                    sheet_keys.add(sheet_key)
+                    references |= reference
+        return references
 
-        # Get actual data now
-        attrs = line.attributes_json or {}
-        _logger.info(f"📦 Line {line_id} attributes_json: {attrs}")
+    @api.model
+    def _get_reference_sheets_by_category(self, lines):
+        """{category id: {sheet id: crm.reference.sheet}} of the templates of ``lines``."""
+        return {
+            category.id: category._get_reference_sheets()
+            for category in lines.product_template_id.categ_id
+        }
 
-        # Build the actual row data that will be inserted
-        row_data = []
-        for col_meta in columns_meta:
-            field_name = col_meta['name']
+    def _get_lines_insert_commands(self, lines, current_sheet_ids):
+        """Commands adding material lines to the spreadsheet, in its layout."""
+        if self.calculator_layout == 'consolidated':
+            return self._get_band_insert_commands(lines, current_sheet_ids)
+        reference_sheets = self._get_reference_sheets_by_category(lines)
+        commands = []
+        for line in lines:
+            commands.extend(self._get_insert_list_commands(
+                line, current_sheet_ids, reference_sheets.get(line.product_template_id.categ_id.id),
+            ))
+        return commands
 
-            if field_name in line._fields:
-                # Standard field
-                val = line[field_name]
-                if hasattr(val, 'display_name'):
-                    cell_value = val.display_name
-                else:
-                    cell_value = val if val is not False else ''
-            else:
-                # Dynamic attribute
-                cell_value = attrs.get(field_name, '')
+    def _get_insert_list_commands(self, line, current_sheet_ids, reference_sheets=None):
+        """
+        Commands creating the sheet of a material line: list, row data,
+        table and category template, plus the auxiliary sheets of the
+        template that are not in ``current_sheet_ids`` yet (which is
+        updated with them).
 
-            row_data.append(cell_value)
-            _logger.info(f"  📝 {field_name} = {cell_value}")
+        :param reference_sheets: reference sheets of the line's category,
+            resolved from the line when not given
+        """
+        line_id = line.id
+        commands = []
+
+        sheet_id = f"sheet_{line.id}"
+        list_id = str(line.id)
+        product_name = (line.product_template_id.display_name or "Item")[:31]
 
+        columns = self._get_material_line_columns(line)
 
+        _logger.info(f"🔧 Creating sheet for line {line_id} with columns: {columns}")
+
+        cells = self._get_material_line_cells(line, columns)
+        columns_meta = [col_meta for col_meta, _content in cells]
 
         # Always create sheet and insert list first (Default behavior)
         # ✅ FORCE position 0 to ensure Main sheet is always first (before Aux sheets)
@@ -768,15 +955,7 @@ class CrmLeadSpreadsheet(models.Model):
             'position': 0 
         })
         
-        commands.append({
-            'type': 'REGISTER_ODOO_LIST',
-            'listId': list_id,
-            'model': 'crm.material.line',
-            'columns': columns,
-            'domain': [['id', '=', line.id]],
-            'context': {},
-            'orderBy': [],
-        })
+        commands.append(self._get_register_list_command(line, columns))
         
         commands.append({
             'type': 'RE_INSERT_ODOO_LIST',
@@ -789,15 +968,14 @@ class CrmLeadSpreadsheet(models.Model):
         })
 
         # Insert actual cell values immediately after creating the list
-        for col_idx, (col_meta, cell_value) in enumerate(zip(columns_meta, row_data)):
+        for col_idx, (col_meta, content) in enumerate(cells):
             # 1. Data row
             commands.append({
                 'type': 'UPDATE_CELL',
                 'sheetId': sheet_id,
                 'col': col_idx,
                 'row': 1,  # Row 1 is data row (Row 0 is header)
-                'content': str(cell_value)
-                if cell_value not in (None, False, '') else '',
+                'content': content,
             })
 
             # 2. Header cleanup (for "__1" style names)
@@ -835,141 +1013,434 @@ class CrmLeadSpreadsheet(models.Model):
             },
         })
 
-        # Check for template and append if exists
-        template_data = None
-        if line.product_template_id.categ_id.spreadsheet_data:
-            try:
-                template_data = json.loads(line.product_template_id.categ_id.spreadsheet_data)
-            except Exception:
-                pass
+        # Append the category template from its precompiled command plan
+        plan = line.product_template_id.categ_id._get_template_plan()
 
-        if template_data and template_data.get('sheets'):
+        if plan:
             _logger.info(f"📄 Merging template for line {line_id}")
-            
-            # Collect all sheet names for dynamic reference fixing
-            all_sheet_names = [s.get('name') for s in template_data.get('sheets', [])]
-
-            # 1. Main Sheet (Index 0) - Apply to sheet_id with offset
-            main_sheet = template_data['sheets'][0]
-            main_sheet_name = main_sheet.get('name')
-            main_sheet_info = {
-                'name': main_sheet_name, 
-                'new_name': product_name,  # ✅ New name after merge
-                'offset': 4
-            }
 
-            # Pass new_sheet_name=product_name to fix self-references
-            template_cmds = self._get_sheet_populate_commands(
-                main_sheet, 
-                sheet_id, 
-                row_offset=4, 
-                new_sheet_name=product_name,
-                all_sheet_names=all_sheet_names,
-                main_sheet_info=main_sheet_info
-            )
-            commands.extend(template_cmds)
+            # 1. Main Sheet - commands already shifted by 4 rows and renamed
+            commands.extend(self._instantiate_plan_commands(
+                plan['main']['commands'], sheet_id, product_name
+            ))
 
-            # 2. Auxiliary Sheets (Index 1+)
-            # We need to check if they exist in the spreadsheet already
-            current_data = json.loads(self.raw_spreadsheet_data) if self.raw_spreadsheet_data else {}
-            current_sheet_ids = {s.get('id') for s in current_data.get('sheets', [])}
+            # 2. Auxiliary Sheets
+            if reference_sheets is None:
+                reference_sheets = line.product_template_id.categ_id._get_reference_sheets()
+            commands.extend(self._get_plan_aux_commands(
+                plan, product_name, current_sheet_ids, reference_sheets,
+            ))
 
-            # 🎯 SORT auxiliary sheets: Profile Master → Resin → Helper → Others
-            # This ensures correct tab order when spreadsheet opens
-            aux_sheets = template_data['sheets'][1:]
-            
-            def sheet_order(s):
-                name = (s.get('name') or "").lower()
-                if "profile master" in name or "profile" in name:
-                    return 1
-                if "resin" in name:
-                    return 2
-                if "helper" in name:
-                    return 3
-                return 99
-
-            aux_sheets.sort(key=sheet_order)
-
-            for idx, aux_sheet in enumerate(aux_sheets, start=1):
-                aux_id = aux_sheet.get('id')
+        # Final update command
+        commands.append({'type': 'UPDATE_ODOO_LIST_DATA', 'listId': list_id})
+        return commands
+
+    def _get_plan_aux_commands(self, plan, main_sheet_name, current_sheet_ids, reference_sheets=None):
+        """
+        Commands creating the auxiliary sheets of a template plan that are
+        not in ``current_sheet_ids`` yet (which is updated with them).
+
+        :param reference_sheets: {sheet id: crm.reference.sheet} of the plan
+            sheets served with the session: they are not created, the caller
+            links them (see ``_link_reference_sheets``)
+        """
+        commands = []
+        reference_sheets = reference_sheets or {}
+        # Already sorted Profile Master → Resin → Helper → Others
+        for idx, aux_sheet in enumerate(plan['aux'], start=1):
+            aux_id = aux_sheet.get('id')
+
+            if aux_id in reference_sheets and aux_id not in current_sheet_ids:
+                current_sheet_ids.add(aux_id)
+                continue
+
+            # Check if already exists in current data OR in pending revisions
+            if aux_id and aux_id not in current_sheet_ids:
+                _logger.info(f"📄 Adding auxiliary sheet {aux_id} ({aux_sheet.get('name')})")
                 
-                # Check if already exists in current data OR in pending revisions
-                is_duplicate = False
-                if aux_id in current_sheet_ids:
-                    is_duplicate = True
+                # Create sheet with explicit position
+                commands.append({
+                    'type': 'CREATE_SHEET', 
+                    'sheetId': aux_id, 
+                    'name': aux_sheet.get('name'),
+                    'position': idx  # ✅ Force position 1, 2, 3...
+                })
+                
+                # Reference sheets were compiled without row offset
+                commands.extend(self._instantiate_plan_commands(
+                    aux_sheet['commands'], aux_id, main_sheet_name
+                ))
+                
+                # Mark as added to avoid duplicates for the next lines of the batch
+                current_sheet_ids.add(aux_id)
+        return commands
+
+    def _get_material_line_cells(self, line, columns):
+        """
+        ``[(column metadata, data cell content)]`` of the list columns of a
+        material line sheet.
+        """
+        line_fields = self.env['crm.material.line']._fields
+        attrs = line.attributes_json or {}
+        _logger.info(f"📦 Line {line.id} attributes_json: {attrs}")
+
+        cells = []
+        for field_name in columns:
+            if field_name in line_fields:
+                # Standard field
+                col_meta = {'name': field_name, 'type': line_fields[field_name].type}
+                val = line[field_name]
+                if hasattr(val, 'display_name'):
+                    cell_value = val.display_name
                 else:
-                    # Check DB for pending commands creating this sheet
-                    domain = [
-                        ('res_id', '=', self.id),
-                        ('res_model', '=', self._name),
-                        ('commands', 'ilike', aux_id)
-                    ]
-                    if self.env['spreadsheet.revision'].search_count(domain):
-                        is_duplicate = True
-
-                if aux_id and not is_duplicate:
-                    _logger.info(f"📄 Adding auxiliary sheet {aux_id} ({aux_sheet.get('name')})")
-                    
-                    # Create sheet with explicit position
-                    commands.append({
-                        'type': 'CREATE_SHEET', 
-                        'sheetId': aux_id, 
-                        'name': aux_sheet.get('name', 'Sheet')[:31],
-                        'position': idx  # ✅ Force position 1, 2, 3...
-                    })
-                    
-                    # Populate (No offset for reference sheets)
-                    # Auxiliary sheets (Helper, Resin, Profile Master) are reference sheets
-                    # They should NOT have row offset applied
-                    aux_cmds = self._get_sheet_populate_commands(
-                        aux_sheet, 
-                        aux_id, 
-                        row_offset=0,  # ✅ Changed from 4 to 0
-                        new_sheet_name=aux_sheet.get('name'),
-                        all_sheet_names=all_sheet_names,
-                        main_sheet_info=main_sheet_info
-                    )
-                    commands.extend(aux_cmds)
-                    
-                    # Mark as added to avoid duplicates in this very loop (though unlikely)
-                    current_sheet_ids.add(aux_id)
+                    cell_value = val if val is not False else ''
+            else:
+                # Dynamic attribute - treat as char
+                col_meta = {'name': field_name, 'type': 'char'}
+                cell_value = attrs.get(field_name, '')
 
-        # Final update command
-        commands.append({'type': 'UPDATE_ODOO_LIST_DATA', 'listId': list_id})
+            _logger.info(f"  📝 {field_name} = {cell_value}")
+            cells.append((col_meta, str(cell_value) if cell_value not in (None, False, '') else ''))
+        return cells
 
-        _logger.info(f"📤 Dispatching {len(commands)} commands for sheet {sheet_id}")
-        self._dispatch_commands(commands)
+    def _get_register_list_command(self, line, columns):
+        return {
+            'type': 'REGISTER_ODOO_LIST',
+            'listId': str(line.id),
+            'model': 'crm.material.line',
+            'columns': columns,
+            'domain': [['id', '=', line.id]],
+            'context': {},
+            'orderBy': [],
+        }
+
+    # ------------------------------------------------------------------
+    # CONSOLIDATED LAYOUT (one sheet, one row band per line)
+    # ------------------------------------------------------------------
+    def _get_line_bands(self):
+        """{material line id: {'top', 'height', 'width', 'columns', 'listId'}} of the consolidated sheet."""
+        self.ensure_one()
+        try:
+            bands = json.loads(self.line_band_layout or '{}')
+        except ValueError:
+            return {}
+        return {int(line_id): band for line_id, band in bands.items()}
+
+    def _set_line_bands(self, bands):
+        self.line_band_layout = json.dumps({str(line_id): band for line_id, band in bands.items()})
+
+    def _get_band_insert_commands(self, lines, current_sheet_ids):
+        """
+        Commands appending the bands of material lines to the consolidated
+        sheet (created first if missing).
+
+        A band is the line sheet of the per-line layout moved down to its
+        top row: list header and data rows, then the category template.
+        Each band has the list of its line, as a line sheet does, so field
+        syncs of a band write back to its line whatever the bands above.
+        Auxiliary sheets are shared as in the per-line layout.
+        """
+        bands = self._get_line_bands()
+        commands = []
+        if CONSOLIDATED_SHEET_ID not in current_sheet_ids:
+            commands.append({
+                'type': 'CREATE_SHEET',
+                'sheetId': CONSOLIDATED_SHEET_ID,
+                'name': CONSOLIDATED_SHEET_NAME,
+                'position': 0,
+            })
+            current_sheet_ids.add(CONSOLIDATED_SHEET_ID)
+            # Bands of a previous sheet are gone with it
+            bands = {}
+
+        top = max((band['top'] + band['height'] + BAND_GAP for band in bands.values()), default=0)
+        reference_sheets = self._get_reference_sheets_by_category(lines)
+        for line in lines:
+            if line.id in bands:
+                continue
+            band_commands, bands[line.id] = self._get_band_commands(
+                line, top, current_sheet_ids, reference_sheets.get(line.product_template_id.categ_id.id),
+            )
+            commands.extend(band_commands)
+            top += bands[line.id]['height'] + BAND_GAP
+
+        self._set_line_bands(bands)
+        _logger.info(f"🧱 {len(lines)} lines banded on {CONSOLIDATED_SHEET_NAME}, {len(bands)} bands")
+        return commands
+
+    def _get_band_commands(self, line, top, current_sheet_ids, reference_sheets=None):
+        """
+        Commands writing the band of a material line from row ``top``.
+
+        :param reference_sheets: reference sheets of the line's category,
+            resolved from the line when not given
+
+        :return: (commands, band)
+        """
+        columns = self._get_material_line_columns(line)
+        cells = self._get_material_line_cells(line, columns)
+        commands = self._get_band_row_commands(line, columns, cells, top)
+
+        plan = line.product_template_id.categ_id._get_template_plan()
+        if plan:
+            commands.extend(self._shift_band_commands(self._instantiate_plan_commands(
+                plan['main']['commands'], CONSOLIDATED_SHEET_ID, CONSOLIDATED_SHEET_NAME
+            ), top))
+
+        bottom, right = top + 1, len(columns) - 1
+        for cmd in commands:
+            if cmd['type'] == 'UPDATE_CELL':
+                bottom, right = max(bottom, cmd['row']), max(right, cmd['col'])
+            elif cmd['type'] == 'ADD_MERGE':
+                for target in cmd['target']:
+                    min_col, min_row, max_col, max_row = range_boundaries(target)
+                    bottom, right = max(bottom, max_row - 1), max(right, max_col - 1)
+
+        if plan:
+            # Aux sheets created here read this band, like they read the
+            # sheet of the line creating them in the per-line layout
+            if reference_sheets is None:
+                reference_sheets = line.product_template_id.categ_id._get_reference_sheets()
+            commands.extend(self._shift_main_sheet_references(self._get_plan_aux_commands(
+                plan, CONSOLIDATED_SHEET_NAME, current_sheet_ids, reference_sheets,
+            ), top))
+        commands.extend(self._get_band_list_commands(line, columns))
+        return commands, {
+            'top': top,
+            'height': bottom - top + 1,
+            'width': right + 1,
+            'columns': columns,
+            'listId': str(line.id),
+        }
+
+    def _get_band_list_commands(self, line, columns):
+        """Commands registering the list of a band, on the consolidated sheet."""
+        return [
+            dict(self._get_register_list_command(line, columns), sheetId=CONSOLIDATED_SHEET_ID),
+            {'type': 'UPDATE_ODOO_LIST_DATA', 'listId': str(line.id)},
+        ]
+
+    def _get_band_row_commands(self, line, columns, cells, top, clear_width=0):
+        """
+        Header and data rows of the band of ``line``. Positions up to
+        ``clear_width`` beyond the columns are emptied (columns dropped
+        from the list).
+        """
+        list_id = str(line.id)
+        commands = []
+        for col_idx in range(max(len(columns), clear_width)):
+            if col_idx < len(columns):
+                field_name = columns[col_idx]
+                if "__" in field_name:
+                    header = field_name.split("__")[0]
+                else:
+                    header = f'=ODOO.LIST.HEADER({list_id},"{field_name}")'
+                content = cells[col_idx][1]
+            else:
+                header = content = ''
+            commands.extend([
+                {'type': 'UPDATE_CELL', 'sheetId': CONSOLIDATED_SHEET_ID, 'col': col_idx, 'row': top, 'content': header},
+                {'type': 'UPDATE_CELL', 'sheetId': CONSOLIDATED_SHEET_ID, 'col': col_idx, 'row': top + 1, 'content': content},
+            ])
+        return commands
+
+    def _shift_band_commands(self, commands, top):
+        """
+        Move template commands down to a band: positions, merges, row sizes
+        and validation ranges by ``top`` rows, and the references of
+        formulas within the consolidated sheet with them. References to
+        the auxiliary sheets are kept.
+        """
+        if not top:
+            return commands
+        shifter = FormulaShifter(rows=top, local_only=True)
+        rewriter = FormulaRewriter(row_shifts={CONSOLIDATED_SHEET_NAME: top})
+
+        def shift_range(rng):
+            min_col, min_row, max_col, max_row = range_boundaries(rng)
+            start = f"{get_column_letter(min_col)}{min_row + top}"
+            end = f"{get_column_letter(max_col)}{max_row + top}"
+            return start if start == end else f"{start}:{end}"
+
+        shifted = []
+        for cmd in commands:
+            if cmd['type'] == 'UPDATE_CELL':
+                cmd = dict(cmd, row=cmd['row'] + top)
+                if cmd['content'].startswith('='):
+                    cmd['content'] = rewriter.rewrite(shifter.shift(cmd['content']))
+            elif cmd['type'] == 'ADD_MERGE':
+                cmd = dict(cmd, target=[shift_range(target) for target in cmd['target']])
+            elif cmd['type'] == 'RESIZE_COLUMNS_ROWS' and cmd['dimension'] == 'ROW':
+                cmd = dict(cmd, elements=[element + top for element in cmd['elements']])
+            elif cmd['type'] == 'ADD_DATA_VALIDATION_RULE':
+                cmd = dict(cmd, ranges=[shift_range(rng) for rng in cmd['ranges']])
+            shifted.append(cmd)
+        return shifted
+
+    def _shift_main_sheet_references(self, commands, top):
+        """
+        Move the references of auxiliary sheet formulas to the consolidated
+        sheet down to the band starting at row ``top``.
+
+        Auxiliary sheets are shared by the lines of a template: the ones
+        reading the line cells read the band of the line that created them
+        only, as they read that line's sheet in the per-line layout.
+        """
+        if not top:
+            return commands
+        rewriter = FormulaRewriter(row_shifts={CONSOLIDATED_SHEET_NAME: top})
+        return [
+            dict(cmd, content=rewriter.rewrite(cmd['content']))
+            if cmd['type'] == 'UPDATE_CELL' and cmd['content'].startswith('=') else cmd
+            for cmd in commands
+        ]
+
+    def _sync_line_bands(self, column_set_only=False):
+        """
+        Consolidated counterpart of ``_sync_sheets_with_material_lines``:
+        bands of removed lines are cleared with their list, the rows and
+        list of bands whose columns changed rewritten and new lines
+        appended, all in one revision.
+        """
+        data = json.loads(self.raw_spreadsheet_data) if self.raw_spreadsheet_data else {}
+        current_sheet_ids = {s.get('id') for s in data.get('sheets', [])}
+        current_sheet_ids |= self._get_aux_sheet_ids()
+        if CONSOLIDATED_SHEET_ID not in current_sheet_ids:
+            if self.lead_id.material_line_ids and not column_set_only:
+                self._dispatch_insert_list_revisions(self.lead_id.material_line_ids)
+            return
+
+        bands = self._get_line_bands()
+        lines = self.lead_id.material_line_ids
+        commands = []
+        # Bands listed by the former lead list get the list of their line
+        legacy_line_ids = {line_id for line_id, band in bands.items() if 'listId' not in band}
+
+        removed_line_ids = set() if column_set_only else set(bands) - set(lines.ids)
+        for line_id in removed_line_ids:
+            band = bands.pop(line_id)
+            commands.append({
+                'type': 'DELETE_CONTENT',
+                'sheetId': CONSOLIDATED_SHEET_ID,
+                'target': [{
+                    'top': band['top'], 'bottom': band['top'] + band['height'] - 1,
+                    'left': 0, 'right': band['width'] - 1,
+                }],
+            })
+            if 'listId' in band:
+                commands.append({'type': 'UNREGISTER_ODOO_LIST', 'listId': band['listId']})
+
+        for line in lines.filtered(lambda l: l.id in bands):
+            band = bands[line.id]
+            columns = self._get_material_line_columns(line)
+            if line.id in legacy_line_ids:
+                columns_changed = True
+            elif column_set_only:
+                columns_changed = set(band['columns']) != set(columns)
+            else:
+                columns_changed = band['columns'] != columns
+            if columns_changed:
+                _logger.info(f"♻️ Columns changed for line {line.id}. Updating its band.")
+                if 'listId' in band:
+                    commands.append({'type': 'UNREGISTER_ODOO_LIST', 'listId': band['listId']})
+                commands.extend(self._get_band_row_commands(
+                    line, columns, self._get_material_line_cells(line, columns), band['top'],
+                    clear_width=len(band['columns']),
+                ))
+                commands.extend(self._get_band_list_commands(line, columns))
+                band.update(columns=columns, width=max(band['width'], len(columns)), listId=str(line.id))
+        if legacy_line_ids:
+            commands.append({'type': 'UNREGISTER_ODOO_LIST', 'listId': CONSOLIDATED_LIST_ID})
+
+        self._set_line_bands(bands)
+        new_lines = self.env['crm.material.line'] if column_set_only else lines.filtered(lambda l: l.id not in bands)
+        if new_lines:
+            self._link_reference_sheets(new_lines, current_sheet_ids)
+            commands.extend(self._get_band_insert_commands(new_lines, current_sheet_ids))
+        if commands:
+            self._dispatch_commands(commands)
+
+    # ------------------------------------------------------------------
+    # INITIAL SNAPSHOT (creation without revision replay)
+    # ------------------------------------------------------------------
+    def _write_initial_snapshot(self):
+        """
+        Store the populated calculator as the spreadsheet data, with an
+        empty revision log.
+
+        The insert commands of every material line are built as for
+        ``_dispatch_insert_list_revisions`` and applied to the empty data on
+        the server, so opening the calculator loads the snapshot instead of
+        replaying the insert revisions.
+
+        :return: False when the commands cannot be applied server side
+            (the caller then dispatches them as a revision)
+        """
+        self.ensure_one()
+        lines = self.lead_id.material_line_ids
+        # Same base as _empty_spreadsheet_data: no default sheet, the line
+        # and aux sheets are the only ones, as with revision replay
+        data = super()._empty_spreadsheet_data() or {}
+        data.setdefault('lists', {})
+        data['sheets'] = []
+        current_sheet_ids = {s.get('id') for s in data.get('sheets', [])}
+        # Linked once the data is written: writing it clears the
+        # collaborative data, reference sheet links included
+        references = self._get_reference_sheets_to_link(lines, current_sheet_ids)
+        commands = self._get_lines_insert_commands(lines, current_sheet_ids)
+        try:
+            self._apply_commands_to_data(data, commands)
+        except (AttributeError, KeyError, TypeError, ValueError) as e:
+            _logger.warning(f"⚠️ Initial snapshot not possible for spreadsheet {self.id}, using revisions: {e}")
+            return False
+        self._set_line_sheet_index(data, self._get_line_sheet_index(data))
+
+        data_json = json.dumps(data)
+        self.write({'spreadsheet_data': data_json, 'raw_spreadsheet_data': data_json})
+        self.reference_sheet_ids |= references
+        # Aux sheets live in the snapshot, not in revisions
+        self.aux_sheet_registry_ready = True
+        self._update_aux_sheet_registry(commands)
+        _logger.info(f"📸 Initial snapshot for spreadsheet {self.id}: {len(lines)} lines, {len(commands)} commands applied")
+        return True
 
     # ------------------------------------------------------------------
     # SYNC WITH MATERIAL LINES
     # ------------------------------------------------------------------
-    def _sync_sheets_with_material_lines(self):
+    def _sync_sheets_with_material_lines(self, column_set_only=False):
+        """
+        Reconcile the line sheets with the lead's material lines.
+
+        :param column_set_only: only recreate the sheets whose set of columns
+            changed, ignoring column order and added or removed lines. Used
+            for writes coming from this very spreadsheet, which already shows
+            the written values.
+        """
         self.ensure_one()
         if not self.lead_id:
             return
+        if self.calculator_layout == 'consolidated':
+            return self._sync_line_bands(column_set_only)
 
         data = json.loads(self.raw_spreadsheet_data) if self.raw_spreadsheet_data else {}
-        current_sheets = data.get('sheets', [])
         current_lists = data.get('lists', {})
         current_line_ids = set(self.lead_id.material_line_ids.ids)
 
+        line_index = self._get_line_sheet_index(data)
+        sheet_names = {sheet.get('id'): sheet.get('name') for sheet in data.get('sheets', [])}
+
         # Remove deleted
-        for sheet in current_sheets:
-            sid = sheet.get('id')
-            if sid and sid.startswith("sheet_"):
-                try:
-                    line_id = int(sid.replace("sheet_", ""))
-                    if line_id not in current_line_ids:
-                        self._delete_sheet_for_material_line(line_id)
-                except Exception:
-                    pass
+        removed_line_ids = set() if column_set_only else set(line_index) - current_line_ids
+        for line_id in removed_line_ids:
+            try:
+                self._delete_sheet_for_material_line(line_id)
+            except Exception:
+                pass
 
         # Re-add missing OR update if columns changed
-        existing_sheet_ids = {
-            int(s['id'].replace('sheet_', ''))
-            for s in current_sheets
-            if s.get('id', '').startswith('sheet_')
-        }
+        existing_sheet_ids = set(line_index)
+        lines_to_insert = self.env['crm.material.line']
+        column_commands = []
 
         for line in self.lead_id.material_line_ids:
             # 2. Check if sheet exists
@@ -980,22 +1451,77 @@ class CrmLeadSpreadsheet(models.Model):
 
                     expected_columns = self._get_material_line_columns(line)
 
-                    if current_columns != expected_columns:
+                    if column_set_only:
+                        columns_changed = set(current_columns) != set(expected_columns)
+                    else:
+                        columns_changed = current_columns != expected_columns
+                    if columns_changed:
+                        # Same product (sheet named after it): same template,
+                        # only the list columns move
+                        product_name = (line.product_template_id.display_name or "Item")[:31]
+                        sheet_id = line_index[line.id]['sheetId']
+                        if sheet_names.get(sheet_id) == product_name:
+                            _logger.info(
+                                f"♻️ Columns changed for line {line.id}. "
+                                f"Updating list columns."
+                            )
+                            column_commands.extend(self._get_column_update_commands(
+                                line, current_columns, expected_columns, sheet_id
+                            ))
+                            current_lists[list_id]['columns'] = expected_columns
+                            continue
                         _logger.info(
                             f"♻️ Columns changed for line {line.id}. "
                             f"Re-creating sheet."
                         )
                         self._delete_sheet_for_material_line(line.id)
-                        self.with_context(
-                            material_line_id=line.id
-                        )._dispatch_insert_list_revision()
+                        lines_to_insert |= line
                         continue
 
             # 3. Create if missing
-            if line.id not in existing_sheet_ids:
-                self.with_context(
-                    material_line_id=line.id
-                )._dispatch_insert_list_revision()
+            if line.id not in existing_sheet_ids and not column_set_only:
+                lines_to_insert |= line
+
+        if column_commands:
+            self._dispatch_commands(column_commands)
+            # Compare with the new columns on next sync
+            self.raw_spreadsheet_data = json.dumps(data)
+
+        if lines_to_insert:
+            self._dispatch_insert_list_revisions(lines_to_insert)
+
+    def _get_column_update_commands(self, line, old_columns, columns, sheet_id):
+        """
+        Commands moving the list of a line sheet from ``old_columns`` to
+        ``columns`` in place: the list is registered again and only the
+        header and data cells of the positions whose column changed are
+        rewritten. The rest of the sheet (template, user edits) is kept.
+        """
+        list_id = str(line.id)
+        cells = self._get_material_line_cells(line, columns)
+        commands = [
+            {'type': 'UNREGISTER_ODOO_LIST', 'listId': list_id},
+            self._get_register_list_command(line, columns),
+        ]
+        for col_idx in range(max(len(old_columns), len(columns))):
+            if col_idx < len(columns):
+                if col_idx < len(old_columns) and old_columns[col_idx] == columns[col_idx]:
+                    continue
+                field_name = columns[col_idx]
+                if "__" in field_name:
+                    header = field_name.split("__")[0]
+                else:
+                    header = f'=ODOO.LIST.HEADER({list_id},"{field_name}")'
+                content = cells[col_idx][1]
+            else:
+                # Column dropped from the end
+                header = content = ''
+            commands.extend([
+                {'type': 'UPDATE_CELL', 'sheetId': sheet_id, 'col': col_idx, 'row': 0, 'content': header},
+                {'type': 'UPDATE_CELL', 'sheetId': sheet_id, 'col': col_idx, 'row': 1, 'content': content},
+            ])
+        commands.append({'type': 'UPDATE_ODOO_LIST_DATA', 'listId': list_id})
+        return commands
 
     # ------------------------------------------------------------------
     # CREATE SHEET STRUCTURE
@@ -1034,6 +1560,10 @@ class CrmLeadSpreadsheet(models.Model):
     # DELETE SHEET
     # ------------------------------------------------------------------
     def _delete_sheet_for_material_line(self, material_line_id):
+        if self.calculator_layout == 'consolidated':
+            # Clears the bands of every line gone from the lead
+            return self._sync_line_bands()
+
         sheet_id = f"sheet_{material_line_id}"
         list_id = str(material_line_id)
 
@@ -1052,13 +1582,16 @@ class CrmLeadSpreadsheet(models.Model):
             return
         try:
             data = json.loads(self.raw_spreadsheet_data)
-            sid = f"sheet_{material_line_id}"
+            line_index = self._get_line_sheet_index(data)
+            entry = line_index.pop(material_line_id, None) or {}
+            sid = entry.get('sheetId') or f"sheet_{material_line_id}"
             if 'sheets' in data:
                 data['sheets'] = [
                     s for s in data['sheets'] if s.get('id') != sid
                 ]
             if 'lists' in data and str(material_line_id) in data['lists']:
                 del data['lists'][str(material_line_id)]
+            self._set_line_sheet_index(data, line_index)
             self.raw_spreadsheet_data = json.dumps(data)
         except Exception:
             pass
@@ -1123,6 +1656,7 @@ class CrmLeadSpreadsheet(models.Model):
         if not self.lead_id or not self.lead_id.material_line_ids:
             return []
 
+        consolidated = self.calculator_layout == 'consolidated'
         lists = []
         for line in self.lead_id.material_line_ids:
             columns = self._get_material_line_columns(line)
@@ -1133,7 +1667,26 @@ class CrmLeadSpreadsheet(models.Model):
                 'field_names': columns,
                 'columns': columns,
                 'name': line.product_template_id.display_name or f"Item {line.id}",
-                'sheetId': f"sheet_{line.id}",
+                # Bands of the consolidated sheet have the list of their line
+                'sheetId': CONSOLIDATED_SHEET_ID if consolidated else f"sheet_{line.id}",
             })
 
-        return lists
\ No newline at end of file
+        return lists
+
+
+class CrmLeadSpreadsheetAuxSheet(models.Model):
+    _name = 'crm.lead.spreadsheet.aux.sheet'
+    _description = 'CRM Quotation Spreadsheet Auxiliary Sheet'
+
+    spreadsheet_id = fields.Many2one(
+        'crm.lead.spreadsheet',
+        required=True,
+        ondelete='cascade',
+        index=True,
+    )
+    sheet_id = fields.Char(required=True)
+
+    _sql_constraints = [
+        ('spreadsheet_sheet_uniq', 'unique(spreadsheet_id, sheet_id)',
+         'An auxiliary sheet is registered once per spreadsheet.'),
+    ]
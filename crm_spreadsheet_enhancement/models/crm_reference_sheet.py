@@ -0,0 +1,132 @@
+# -*- coding: utf-8 -*-
+from odoo import models, fields, api, tools
+import json
+import logging
+
+from psycopg2 import IntegrityError
+
+from .crm_quote_spreadsheet import PLAN_MAIN_SHEET_NAME
+
+_logger = logging.getLogger(__name__)
+
+
+class CrmReferenceSheet(models.Model):
+    """
+    Reference data sheet of a category template (Profile Master, Resin...),
+    imported once per template content and served to the calculators when
+    their session is joined instead of being copied into each of them.
+    """
+    _name = 'crm.reference.sheet'
+    _description = 'CRM Calculator Reference Sheet'
+    _order = 'template_checksum, sequence'
+
+    name = fields.Char(required=True)
+    sequence = fields.Integer(default=10)
+    sheet_key = fields.Char(
+        string="Sheet Id", required=True,
+        help="Id of the sheet in the calculators, shared by every calculator of the template.",
+    )
+    template_checksum = fields.Char(required=True, index=True)
+    sheet_data = fields.Text(
+        string="Sheet Data", required=True,
+        help="The sheet as calculators load it: cells, merges, sizes and data validations.",
+    )
+    cell_count = fields.Integer(string="Cells")
+
+    _sql_constraints = [
+        ('template_sheet_uniq', 'unique(template_checksum, sheet_key)',
+         'A reference sheet is imported once per template.'),
+    ]
+
+    @api.model
+    def _import_template_reference_sheets(self, checksum, plan):
+        """
+        Import the reference sheets of a template command plan that are not
+        imported yet. Called when the template is saved on a category.
+
+        Auxiliary sheets are reference data when their content does not
+        depend on the material line: none of their formulas point at the
+        line sheet. Concurrent imports of the same template are harmless:
+        the one losing the race finds the sheets the other one imported.
+        """
+        sheet_keys = self._get_reference_sheet_keys(checksum, plan)
+        if not sheet_keys:
+            return
+        existing = set(self.search([('template_checksum', '=', checksum)]).mapped('sheet_key'))
+        vals_list = []
+        for sequence, aux_sheet in enumerate(plan['aux']):
+            if aux_sheet.get('id') in sheet_keys and aux_sheet['id'] not in existing:
+                sheet_json = self._build_reference_sheet(aux_sheet)
+                vals_list.append({
+                    'name': aux_sheet.get('name'),
+                    'sequence': sequence,
+                    'sheet_key': aux_sheet['id'],
+                    'template_checksum': checksum,
+                    'sheet_data': json.dumps(sheet_json),
+                    'cell_count': len(sheet_json['cells']),
+                })
+        if not vals_list:
+            return
+        try:
+            with self.env.cr.savepoint():
+                self.create(vals_list)
+        except IntegrityError:
+            _logger.info(f"📚 Reference sheets of template {checksum[:12]} imported concurrently")
+            return
+        _logger.info(f"📚 Imported {len(vals_list)} reference sheets of template {checksum[:12]}")
+
+    @api.model
+    def _get_template_reference_sheets(self, checksum, plan):
+        """
+        Imported reference sheets of a template command plan; sheets not
+        imported are copied into the calculators like the other auxiliary
+        sheets.
+
+        :return: {sheet id: crm.reference.sheet}
+        """
+        sheet_keys = self._get_reference_sheet_keys(checksum, plan)
+        if not sheet_keys:
+            return {}
+        return {
+            sheet.sheet_key: sheet
+            for sheet in self.search([
+                ('template_checksum', '=', checksum),
+                ('sheet_key', 'in', list(sheet_keys)),
+            ])
+        }
+
+    @tools.ormcache('checksum')
+    def _get_reference_sheet_keys(self, checksum, plan):
+        # content-addressed, like the template plans
+        return tuple(
+            aux_sheet['id'] for aux_sheet in plan['aux']
+            if aux_sheet.get('id') and self._is_reference_plan_sheet(aux_sheet)
+        )
+
+    @api.model
+    def _is_reference_plan_sheet(self, aux_sheet):
+        return not any(
+            cmd['type'] == 'UPDATE_CELL' and PLAN_MAIN_SHEET_NAME in cmd['content']
+            for cmd in aux_sheet['commands']
+        )
+
+    @api.model
+    def _build_reference_sheet(self, aux_sheet):
+        """The sheet the plan commands of ``aux_sheet`` produce once replayed."""
+        spreadsheet = self.env['crm.lead.spreadsheet']
+        commands = [{'type': 'CREATE_SHEET', 'sheetId': aux_sheet['id'], 'name': aux_sheet.get('name')}]
+        commands.extend(spreadsheet._instantiate_plan_commands(aux_sheet['commands'], aux_sheet['id'], ''))
+        return spreadsheet._apply_commands_to_data({}, commands)['sheets'][0]
+
+    def _get_sheet(self):
+        """
+        The sheet to serve. Shared across calls: copy it shallowly before
+        changing it.
+        """
+        self.ensure_one()
+        return self._get_cached_sheet(self.id, self.sheet_data)
+
+    @tools.ormcache('sheet_id')
+    def _get_cached_sheet(self, sheet_id, sheet_data):
+        # imported once and never rewritten, like the template plans
+        return json.loads(sheet_data)
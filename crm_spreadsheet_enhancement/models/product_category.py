@@ -1,13 +1,48 @@
 # -*- coding: utf-8 -*-
-from odoo import models, fields, api
+from odoo import models, fields, api, tools
+import datetime
+import functools
+import hashlib
 import json
 import openpyxl
 import base64
+import zipfile
 from io import BytesIO
 import logging
+import re
 from openpyxl.utils import get_column_letter, column_index_from_string
+from openpyxl.utils.exceptions import InvalidFileException
+from .crm_quote_spreadsheet import TEMPLATE_PLAN_VERSION
 _logger = logging.getLogger(__name__)
 
+# Bump whenever the XLSX converters output changes: parsed templates are
+# only reused for the same content converted by the same version.
+TEMPLATE_CONVERTER_VERSION = 2
+# openpyxl (major, minor) releases the streaming reader was checked against:
+# it drives private openpyxl APIs, other releases use the full load.
+STREAMING_OPENPYXL_VERSIONS = {(3, 1)}
+
+
+@functools.cache
+def _streaming_reader_available():
+    """Whether the installed openpyxl supports the streaming reader; logged once when not."""
+    version = tuple(int(part) for part in re.findall(r'\d+', openpyxl.__version__)[:2])
+    if version not in STREAMING_OPENPYXL_VERSIONS:
+        _logger.warning(
+            "Streaming XLSX ingestion disabled: not checked against openpyxl %s, templates use the full load",
+            openpyxl.__version__,
+        )
+        return False
+    try:
+        from openpyxl.worksheet._reader import WorkSheetParser  # noqa: F401
+    except ImportError:
+        _logger.warning(
+            "Streaming XLSX ingestion disabled: openpyxl %s has no worksheet parser, templates use the full load",
+            openpyxl.__version__,
+        )
+        return False
+    return True
+
 
 class ProductCategory(models.Model):
     _inherit = "product.category"
@@ -22,31 +57,195 @@ class ProductCategory(models.Model):
         compute='_compute_spreadsheet_data',
         store=True
     )
+    template_checksum = fields.Char(
+        string="Template Checksum",
+        compute='_compute_spreadsheet_data',
+        store=True,
+        index=True,
+        copy=False,
+        help="SHA-256 of the uploaded template and the converter version. Conversion "
+             "is skipped when a category already holds the data parsed from the same "
+             "content by the same converter."
+    )
+    template_plan = fields.Text(
+        string="Template Command Plan",
+        compute='_compute_spreadsheet_data',
+        store=True,
+        help="Populate commands compiled from the template at ingest, "
+             "instantiated per material line sheet."
+    )
+    serve_reference_sheets = fields.Boolean(
+        string="Serve Reference Sheets",
+        help="Import the reference data sheets of the template (Profile Master, Resin...) "
+             "once and serve them to the calculators when they are opened, instead of "
+             "copying them into each calculator. They are read-only in the calculators: "
+             "edits made to them are not saved."
+    )
     
     @api.depends('template_file')
     def _compute_spreadsheet_data(self):
+        # parsed results shared by categories uploading the same file in this batch
+        parsed_by_checksum = {}
         for category in self:
-            print("\n=========== DEBUG: _compute_spreadsheet_data ===========")
-            print("CATEGORY:", category.name)
-            print("template_file present?:", bool(category.template_file))
-            
+            _logger.debug("Computing spreadsheet data of category %s (template file: %s)",
+                          category.name, bool(category.template_file))
+
             if category.template_file:
+                checksum = category._get_template_checksum(category.template_file)
+                cached = parsed_by_checksum.get(checksum) or category._find_parsed_template(checksum)
+                if cached:
+                    _logger.debug("Template unchanged (checksum %s), reusing parsed data", checksum[:12])
+                    category.spreadsheet_data, category.template_plan = cached
+                    category.template_checksum = checksum
+                    parsed_by_checksum[checksum] = cached
+                    continue
+
                 excel_data = category._convert_excel_to_spreadsheet(category.template_file)
                 
                 if excel_data:
+                    plan = self.env['crm.lead.spreadsheet']._compile_template_plan(excel_data)
                     category.spreadsheet_data = json.dumps(excel_data)
+                    category.template_plan = json.dumps(plan) if plan else False
+                    category.template_checksum = checksum
+                    parsed_by_checksum[checksum] = (category.spreadsheet_data, category.template_plan)
                     # small checksum for debugging
                     total_cells = sum(len(s.get('cells', {})) for s in excel_data.get('sheets', []))
                     total_merges = sum(len(s.get('merges', [])) for s in excel_data.get('sheets', []))
-                    print("DEBUG: spreadsheet_data saved successfully! sheets:", len(excel_data.get('sheets', [])),
-                          "cells:", total_cells, "merges:", total_merges)
+                    _logger.debug("Template parsed: %s sheets, %s cells, %s merges",
+                                  len(excel_data.get('sheets', [])), total_cells, total_merges)
                 else:
-                    print("DEBUG: excel_data conversion failed!")
+                    category.template_checksum = False
+                    category.template_plan = False
+                    _logger.debug("Template conversion failed for category %s", category.name)
             else:
-                print("DEBUG: template_file is empty!")
+                _logger.debug("No template file on category %s", category.name)
                 category.spreadsheet_data = False
-            
-            print("========================================================\n")
+                category.template_checksum = False
+                category.template_plan = False
+
+    def _get_template_checksum(self, file_data):
+        if isinstance(file_data, str):
+            file_data = file_data.encode()
+        checksum = hashlib.sha256(f"converter-{TEMPLATE_CONVERTER_VERSION}:".encode())
+        checksum.update(base64.b64decode(file_data))
+        return checksum.hexdigest()
+
+    def _find_parsed_template(self, checksum):
+        """
+        Return ``(spreadsheet_data, template_plan)`` stored on any category
+        (this one included) whose template has the given checksum, or None.
+
+        Reads the committed column values directly: going through the ORM
+        here would try to recompute the very fields being computed.
+        """
+        self.env.cr.execute("""
+            SELECT spreadsheet_data, template_plan
+              FROM product_category
+             WHERE template_checksum = %s
+               AND spreadsheet_data IS NOT NULL
+             LIMIT 1
+        """, [checksum])
+        row = self.env.cr.fetchone()
+        return tuple(row) if row else None
+
+    def _get_template_plan(self):
+        """
+        Parsed command plan of the category template (see
+        ``crm.lead.spreadsheet._compile_template_plan``), or False.
+        The parsed plan is shared per template checksum and must not be mutated.
+        """
+        self.ensure_one()
+        if not self.spreadsheet_data:
+            return False
+        if not self.template_checksum:
+            return self._build_template_plan(self.template_plan, self.spreadsheet_data)
+        return self._get_cached_template_plan(self.template_checksum, self.template_plan, self.spreadsheet_data)
+
+    @tools.ormcache('checksum')
+    def _get_cached_template_plan(self, checksum, plan_json, spreadsheet_data):
+        # content-addressed: a new upload gets a new checksum, no invalidation needed
+        return self._build_template_plan(plan_json, spreadsheet_data)
+
+    def _build_template_plan(self, plan_json, spreadsheet_data):
+        plan = json.loads(plan_json) if plan_json else None
+        if not plan or plan.get('version') != TEMPLATE_PLAN_VERSION:
+            # stored before plans existed or by an older compiler
+            plan = self.env['crm.lead.spreadsheet']._compile_template_plan(json.loads(spreadsheet_data))
+        return plan
+
+    def _get_template_sheets(self):
+        """
+        Sheets of the category template with string cell contents and no
+        cell formats, or an empty tuple.
+        The sheets are shared per template checksum and must not be mutated:
+        copy a sheet shallowly to give it its own id and name.
+        """
+        if not self.spreadsheet_data:
+            return ()
+        if not self.template_checksum:
+            return self._build_template_sheets(self.spreadsheet_data)
+        return self._get_cached_template_sheets(self.template_checksum, self.spreadsheet_data)
+
+    @tools.ormcache('checksum')
+    def _get_cached_template_sheets(self, checksum, spreadsheet_data):
+        # content-addressed, like the template plans
+        return self._build_template_sheets(spreadsheet_data)
+
+    def _build_template_sheets(self, spreadsheet_data):
+        try:
+            template_data = json.loads(spreadsheet_data)
+        except ValueError:
+            return ()
+        sheets = []
+        for sheet in template_data.get('sheets') or []:
+            if 'cells' in sheet:
+                cells = {}
+                for cell_key, cell_val in sheet['cells'].items():
+                    cell_val = {key: value for key, value in cell_val.items() if key != 'format'}
+                    if 'content' in cell_val:
+                        cell_val['content'] = str(cell_val['content']) if cell_val['content'] is not None else ""
+                    cells[cell_key] = cell_val
+                sheet = dict(sheet, cells=cells)
+            sheets.append(sheet)
+        return tuple(sheets)
+
+    @api.model_create_multi
+    def create(self, vals_list):
+        categories = super().create(vals_list)
+        categories._import_reference_sheets()
+        return categories
+
+    def write(self, vals):
+        res = super().write(vals)
+        if 'template_file' in vals or vals.get('serve_reference_sheets'):
+            self._import_reference_sheets()
+        return res
+
+    def _import_reference_sheets(self):
+        """Import the reference sheets of the templates served as such."""
+        imported = set()
+        for category in self.filtered('serve_reference_sheets'):
+            checksum = category.template_checksum
+            if not checksum or checksum in imported:
+                continue
+            plan = category._get_template_plan()
+            if plan:
+                self.env['crm.reference.sheet']._import_template_reference_sheets(checksum, plan)
+            imported.add(checksum)
+
+    def _get_reference_sheets(self):
+        """
+        {sheet id: crm.reference.sheet} of the template sheets served to the
+        calculators rather than copied into them, empty unless enabled.
+        """
+        self.ensure_one()
+        if not self.serve_reference_sheets or not self.template_checksum:
+            return {}
+        plan = self._get_template_plan()
+        if not plan:
+            return {}
+        return self.env['crm.reference.sheet']._get_template_reference_sheets(self.template_checksum, plan)
+
     def action_sync_google_sheet(self):
         """
         Fetches the XLSX directly from Google Drive URL and saves it to template_file.
@@ -84,17 +283,20 @@ class ProductCategory(models.Model):
             response = requests.get(export_url, timeout=30)
             
             if response.status_code == 200:
-                # 4. Save to binary field (this triggers the compute method)
-                self.template_file = base64.b64encode(response.content)
-                self.template_filename = "GoogleSheet_Synced.xlsx"
+                # 4. Save to binary field (this triggers the compute method,
+                #    which skips conversion when the content did not change)
+                filename = "GoogleSheet_Synced.xlsx"
                 
                 # Retrieve the sheet name if possible
                 if 'Content-Disposition' in response.headers:
                     fname = re.findall('filename="(.+)"', response.headers['Content-Disposition'])
                     if fname:
-                        self.template_filename = fname[0]
+                        filename = fname[0]
                 
-                self._compute_spreadsheet_data()
+                self.write({
+                    'template_file': base64.b64encode(response.content),
+                    'template_filename': filename,
+                })
                 
                 return {
                     'type': 'ir.actions.client',
@@ -148,9 +350,181 @@ class ProductCategory(models.Model):
             return None
 
 
-    def _convert_excel_to_spreadsheet(self, file_data):
+    def _convert_excel_to_spreadsheet(self, file_data, streaming=True):
         """
         Convert uploaded XLSX (binary base64) into Odoo Spreadsheet JSON structure.
+        Uses the streaming reader by default and falls back to the full
+        workbook load when the streaming pass fails.
+        Returns dict or None on failure.
+        """
+        if streaming and _streaming_reader_available():
+            try:
+                return self._convert_excel_streaming(file_data)
+            except (ImportError, AttributeError, TypeError, KeyError):
+                # openpyxl internals the streaming reader drives changed: see
+                # STREAMING_OPENPYXL_VERSIONS
+                _logger.error(
+                    "Streaming XLSX ingestion does not support openpyxl %s, falling back to full load",
+                    openpyxl.__version__, exc_info=True,
+                )
+            except (zipfile.BadZipFile, InvalidFileException, ValueError) as e:
+                _logger.warning("Streaming XLSX ingestion cannot read the file, falling back to full load: %s", e)
+        return self._convert_excel_full(file_data)
+
+    def _convert_excel_streaming(self, file_data):
+        """
+        Single-pass XLSX ingestion.
+
+        The workbook is opened read-only and each worksheet XML is parsed once:
+        only the ``<c>`` elements present in the file are visited (no
+        ``max_row × max_col`` rectangle walk, no Cell objects), while merges,
+        column widths, row heights and list validations are collected from the
+        same pass.
+
+        Produces the same JSON as ``_convert_excel_full``, without building
+        the full workbook in memory. Only used with the openpyxl releases of
+        ``STREAMING_OPENPYXL_VERSIONS``.
+
+        Raises on unreadable files so the caller can fall back.
+        """
+        # WorkSheetParser is the same parser openpyxl uses internally for
+        # both load modes; driving it directly gives us the populated cells
+        # and the sheet metadata in one iterparse.
+        from openpyxl.worksheet._reader import WorkSheetParser
+
+        file_content = base64.b64decode(file_data)
+        wb = openpyxl.load_workbook(BytesIO(file_content), read_only=True, data_only=False)
+        try:
+            spreadsheet = self._new_template_spreadsheet()
+
+            for ws in wb.worksheets:
+                title = ws.title or "Sheet"
+                cells = {}
+                max_row = max_col = 1
+
+                with ws._get_source() as src:
+                    parser = WorkSheetParser(
+                        src, wb.shared_strings,
+                        data_only=False,
+                        epoch=wb.epoch,
+                        date_formats=wb._date_formats,
+                        timedelta_formats=wb._timedelta_formats,
+                    )
+                    for row_idx, row in parser.parse():
+                        for cell in row:
+                            r, c = cell['row'], cell['column']
+                            if r > max_row:
+                                max_row = r
+                            if c > max_col:
+                                max_col = c
+                            if cell['value'] is None:
+                                continue
+                            cells[f"{get_column_letter(c)}{r}"] = {
+                                "content": self._template_cell_content(cell['value'], cell['data_type']),
+                            }
+
+                merges = []
+                if parser.merged_cells:
+                    for merged in parser.merged_cells.mergeCell:
+                        parsed = self._parse_merge_range(merged.ref)
+                        if parsed:
+                            merges.append(parsed)
+                            # merged areas count towards the used range, as
+                            # they do when openpyxl binds MergedCells
+                            max_row = max(max_row, parsed['bottom'] + 1)
+                            max_col = max(max_col, parsed['right'] + 1)
+
+                sheet_json = self._new_template_sheet(title, max_row, max_col)
+                sheet_json["cells"] = cells
+                sheet_json["merges"] = merges
+
+                for col_letter, attrs in parser.column_dimensions.items():
+                    try:
+                        idx = column_index_from_string(col_letter) - 1
+                        # openpyxl defaults a <col> without width to 13
+                        sheet_json["cols"][str(idx)] = {"width": float(attrs.get('width', 13))}
+                    except Exception:
+                        continue
+
+                for r_idx, attrs in parser.row_dimensions.items():
+                    if attrs.get('ht') is None:
+                        continue
+                    try:
+                        sheet_json["rows"][str(int(r_idx) - 1)] = {"size": float(attrs['ht'])}
+                    except Exception:
+                        continue
+
+                dv_list = getattr(parser, 'data_validations', None)
+                if dv_list and dv_list.dataValidation:
+                    sheet_json['validations'] = self._template_list_validations(dv_list.dataValidation)
+
+                spreadsheet["sheets"].append(sheet_json)
+                _logger.info(
+                    "Streamed sheet %s: %s rows, %s cells, %s merges",
+                    title, max_row, len(cells), len(sheet_json["merges"]),
+                )
+
+            return spreadsheet
+        finally:
+            wb.close()
+
+    def _new_template_spreadsheet(self):
+        return {
+            "version": 16,
+            "sheets": [],
+            "revisionId": 1,
+            "settings": {},
+            "lists": {},
+            "formats": {},
+            "styles": {},
+            "borders": {},
+        }
+
+    def _new_template_sheet(self, title, max_row, max_col):
+        return {
+            # unique id to avoid collision with sheet_<line.id>: prefix template_
+            "id": ("template_" + (title or "Sheet")).replace(" ", "_")[:60],
+            "name": (title or "Sheet")[:31],
+            # colNumber/rowNumber : use counts (Odoo expects integer)
+            "colNumber": int(max_col),
+            "rowNumber": max(int(max_row), 1000) if "profile master" in (title or "").lower() else int(max_row),
+            "cells": {},
+            "merges": [],
+            "rows": {},  # numeric-string keys: "0","1"
+            "cols": {},  # numeric-string keys: "0","1"
+        }
+
+    def _template_cell_content(self, value, data_type):
+        """Stringify a cell value the way the template JSON stores it."""
+        if data_type == 'f':
+            # openpyxl may return formula string without '='
+            raw = str(value) if value is not None else ""
+            return raw if raw.startswith('=') else '=' + raw
+        # openpyxl may return datetime objects for dates — keep them as isoformat strings
+        if isinstance(value, (datetime.date, datetime.datetime)):
+            return value.isoformat()
+        return str(value) if value is not None else ""
+
+    def _template_list_validations(self, data_validations):
+        validations = []
+        for dv in data_validations:
+            # We only care about LIST type for dropdowns usually
+            if dv.type == 'list':
+                # dv.sqref is a generic 'A1:A10 B1:B10' string or MultiCellRange
+                validations.append({
+                    'type': 'list',
+                    'formula1': dv.formula1,
+                    'ranges': str(dv.sqref).split(),
+                    'showErrorMessage': dv.showErrorMessage,
+                    'showInputMessage': dv.showInputMessage,
+                })
+        return validations
+
+    def _convert_excel_full(self, file_data):
+        """
+        Legacy converter: loads the whole workbook and walks the full
+        ``max_row × max_col`` rectangle. Kept as a fallback for files the
+        streaming reader cannot handle.
         Returns dict or None on failure.
         """
         try:
@@ -160,16 +534,7 @@ class ProductCategory(models.Model):
             file_content = base64.b64decode(file_data)
             wb = openpyxl.load_workbook(BytesIO(file_content), data_only=False)
 
-            spreadsheet = {
-                "version": 16,
-                "sheets": [],
-                "revisionId": 1,
-                "settings": {},
-                "lists": {},
-                "formats": {},
-                "styles": {},
-                "borders": {},
-            }
+            spreadsheet = self._new_template_spreadsheet()
 
             for sheet in wb.worksheets:
                 # determine dimensions (fallbacks)
@@ -177,18 +542,7 @@ class ProductCategory(models.Model):
                 max_col = sheet.max_column or 1
 
                 # build sheet_json
-                sheet_json = {
-                    # unique id to avoid collision with sheet_<line.id>: prefix template_
-                    "id": ("template_" + (sheet.title or "Sheet")).replace(" ", "_")[:60],
-                    "name": (sheet.title or "Sheet")[:31],
-                    # colNumber/rowNumber : use counts (Odoo expects integer)
-                    "colNumber": int(max_col),
-                    "rowNumber": max(int(max_row), 1000) if "profile master" in (sheet.title or "").lower() else int(max_row),
-                    "cells": {},
-                    "merges": [],
-                    "rows": {},  # numeric-string keys: "0","1"
-                    "cols": {},  # numeric-string keys: "0","1"
-                }
+                sheet_json = self._new_template_sheet(sheet.title, max_row, max_col)
 
                 # -------------------------
                 # merges: convert to numeric boxes
@@ -250,29 +604,8 @@ class ProductCategory(models.Model):
                         col_letter = get_column_letter(c)
                         key = f"{col_letter}{r}"
 
-                        # decide content: formula vs value
-                        if cell.data_type == 'f':
-                            # openpyxl may return formula string without '='
-                            raw = str(cell.value) if cell.value is not None else ""
-                            content = raw if raw.startswith('=') else '=' + raw
-                        else:
-                            # preserve native python types for numbers/bool
-                            v = cell.value
-                            # openpyxl may return datetime objects for dates — keep them as isoformat strings
-                            try:
-                                import datetime
-                                if isinstance(v, (datetime.date, datetime.datetime)):
-                                    content = v.isoformat()
-                                else:
-                                    content = v
-                            except Exception:
-                                    content = str(v)
-                            except Exception:
-                                content = str(v)
-
-                        # minimal format hint: 1 = default/text (we keep it simple)
                         sheet_json["cells"][key] = {
-                            "content": str(content) if content is not None else "",
+                            "content": self._template_cell_content(cell.value, cell.data_type),
                         }
 
                 # -------------------------
@@ -280,20 +613,9 @@ class ProductCategory(models.Model):
                 # -------------------------
                 try:
                     if hasattr(sheet, 'data_validations') and sheet.data_validations:
-                        sheet_json['validations'] = []
-                        for dv in sheet.data_validations.dataValidation:
-                            # We only care about LIST type for dropdowns usually
-                            if dv.type == 'list':
-                                # dv.sqref is a generic 'A1:A10 B1:B10' string or MultiCellRange
-                                # We'll store it as a list of ranges
-                                ranges = str(dv.sqref).split()
-                                sheet_json['validations'].append({
-                                    'type': 'list',
-                                    'formula1': dv.formula1,
-                                    'ranges': ranges,
-                                    'showErrorMessage': dv.showErrorMessage,
-                                    'showInputMessage': dv.showInputMessage,
-                                })
+                        sheet_json['validations'] = self._template_list_validations(
+                            sheet.data_validations.dataValidation
+                        )
                 except Exception as e:
                     print("DEBUG: reading data_validations failed for sheet", sheet.title, "error:", e)
 
@@ -18,6 +18,32 @@ class ResConfigSettings(models.TransientModel):
 
     )
 
+    crm_calculator_creation_mode = fields.Selection(
+        [('snapshot', 'Initial Snapshot'), ('revisions', 'Revision Replay')],
+        string="Quote Calculator Creation",
+        default='snapshot',
+        config_parameter='crm_spreadsheet_enhancement.calculator_creation_mode',
+    )
+
+    crm_calculator_layout = fields.Selection(
+        [('per_line', 'One Sheet per Line'), ('consolidated', 'Single Sheet')],
+        string="Quote Calculator Layout",
+        default='per_line',
+        config_parameter='crm_spreadsheet_enhancement.calculator_layout',
+    )
+
+    crm_compaction_revision_count = fields.Integer(
+        string="Compact After (Revisions)",
+        default=100,
+        config_parameter='crm_spreadsheet_enhancement.compaction_revision_count',
+    )
+
+    crm_compaction_revision_kb = fields.Integer(
+        string="Compact After (KB)",
+        default=1024,
+        config_parameter='crm_spreadsheet_enhancement.compaction_revision_kb',
+    )
+
     def set_values(self):
         super().set_values()
         config = self.env['ir.config_parameter'].sudo()
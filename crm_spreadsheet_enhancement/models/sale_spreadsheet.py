@@ -5,6 +5,8 @@ from odoo.exceptions import UserError
 import json
 import logging
 
+from odoo.addons.crm_customisation.tools.list_data import read_list_rows
+
 _logger = logging.getLogger(__name__)
 
 SALES_ORDER_LINE_FIELDS = [
@@ -17,15 +19,32 @@ SALES_ORDER_LINE_FIELDS = [
     'thickness',
 ]
 
+# Format of raw_spreadsheet_data, bumped with each converter added to
+# SALES_FORMAT_CONVERTERS. Data of unknown format (stored before formats were
+# versioned, or copied over from a CRM calculator) is version 0 and upgraded
+# once, by the migration or on next open.
+SALES_FORMAT_UNVERSIONED = 0
+SALES_FORMAT_VERSION = 1
+# (version, method converting data of the previous version to it), in order
+SALES_FORMAT_CONVERTERS = [
+    (1, '_upgrade_crm_sheets'),
+]
+# Substrings betraying sheets or lists still in CRM format
+CRM_FORMAT_MARKERS = ('"crm_', 'sheet_crm_', 'crm.material.line')
+
 class SaleOrderSpreadsheet(models.Model):
     _name = 'sale.order.spreadsheet'
-    _inherit = 'spreadsheet.mixin'
+    _inherit = 'crm.spreadsheet.compaction.mixin'
     _description = 'Sales Order Spreadsheet'
 
     name = fields.Char(required=True)
     order_id = fields.Many2one('sale.order', ondelete='set null')
     company_id = fields.Many2one('res.company', default=lambda self: self.env.company)
     raw_spreadsheet_data = fields.Text("Raw Spreadsheet Data")
+    spreadsheet_format_version = fields.Integer(
+        string="Data Format Version", default=SALES_FORMAT_UNVERSIONED, copy=False,
+        help="Format of the raw spreadsheet data; outdated data is converted once, on next open.",
+    )
 
     # ✅ CRITICAL: Override get_list_data for Sales
     @api.model
@@ -38,35 +57,13 @@ class SaleOrderSpreadsheet(models.Model):
         
         try:
             # Extract line ID
-            if list_id.startswith('sales_'):
-                line_id = int(list_id.replace('sales_', ''))
-            else:
-                line_id = int(list_id)
+            line_id = int(str(list_id).replace('sales_', '', 1))
         except (ValueError, TypeError):
             _logger.error(f"❌ Invalid list_id: {list_id}")
             return []
 
-        line = self.env['sale.order.line'].browse(line_id)
-        if not line.exists():
-            _logger.warning(f"❌ Sale order line {line_id} not found")
-            return []
-
-        _logger.info(f"✅ Found sale line {line_id}: {line.product_id.display_name}")
-        
-        row = {"id": line.id}
-
-        for field in field_names:
-            if field in line._fields:
-                val = line[field]
-                if hasattr(val, "display_name"):
-                    row[field] = val.display_name
-                else:
-                    row[field] = val
-                _logger.info(f"✅ Sale field '{field}' = '{row[field]}'")
-            else:
-                row[field] = ""
-
-        return [row]
+        row = read_list_rows(self.env['sale.order.line'], [(line_id, field_names)]).get(line_id)
+        return [row] if row else []
 
     def get_formview_action(self, access_uid=None):
         return self.action_open_spreadsheet()
@@ -200,30 +197,29 @@ class SaleOrderSpreadsheet(models.Model):
         except Exception as e:
             _logger.error(f"❌ Failed to save converted data: {e}")
 
+    def _upgrade_spreadsheet_format(self):
+        """Run the converters of SALES_FORMAT_CONVERTERS the data is behind, once."""
+        for spreadsheet in self:
+            version = spreadsheet.spreadsheet_format_version
+            for converter_version, converter in SALES_FORMAT_CONVERTERS:
+                if version < converter_version:
+                    getattr(spreadsheet, converter)()
+            spreadsheet.spreadsheet_format_version = SALES_FORMAT_VERSION
+            _logger.info(f"✅ Spreadsheet {spreadsheet.id} upgraded from format {version} to {SALES_FORMAT_VERSION}")
+
+    def _upgrade_crm_sheets(self):
+        # Format 1: no sheet or list left in CRM format
+        if self.raw_spreadsheet_data and any(
+                marker in self.raw_spreadsheet_data for marker in CRM_FORMAT_MARKERS):
+            _logger.info("🔄 Converting CRM data to Sales format...")
+            self._convert_crm_sheet_to_sales()
+
     def _sync_order_lines_from_crm(self, crm_lead):
         """Sync order lines from CRM material lines"""
         try:
-            order = self.order_id
-            
-            for material_line in crm_lead.material_line_ids:
-                if material_line.product_id:
-                    existing_line = order.order_line.filtered(
-                        lambda l: l.product_id == material_line.product_id
-                    )
-                    
-                    if not existing_line:
-                        self.env['sale.order.line'].create({
-                            'order_id': order.id,
-                            'product_id': material_line.product_id.id,
-                            'product_uom_qty': material_line.quantity or 1.0,
-                            'price_unit': material_line.price or material_line.product_id.list_price,
-                            'width': material_line.width or 0,
-                            'height': material_line.height or 0,
-                            'length': material_line.length or 0,
-                            'thickness': material_line.thickness or 0,
-                            'name': material_line.product_id.name,
-                        })
-                        
+            # one order line per product not quoted yet, created in one batch
+            crm_lead.material_line_ids._materialize_order_lines(
+                self.order_id, skip_quoted_products=True)
         except Exception as e:
             _logger.error(f"[ORDER_SYNC] Error: {str(e)}")
 
@@ -233,20 +229,12 @@ class SaleOrderSpreadsheet(models.Model):
 
         _logger.info(f"\n🟢 [SALES SESSION] Starting for {self.name}")
 
-        # ✅ CRITICAL: Convert CRM data first
-        converted_from_crm = False
-        if self.raw_spreadsheet_data:
-            crm_detected = any(marker in self.raw_spreadsheet_data 
-                             for marker in ['"crm_', 'sheet_crm_', 'crm.material.line'])
-            if crm_detected:
-                _logger.info("🔄 Converting CRM data to Sales format...")
-                self._convert_crm_sheet_to_sales()
-                converted_from_crm = True
-                _logger.info("✅ Conversion completed")
+        # Outdated data is converted once; current data is loaded as is
+        if self.spreadsheet_format_version < SALES_FORMAT_VERSION:
+            self._upgrade_spreadsheet_format()
 
         # Sync sheets if needed
-        should_sync = not self.raw_spreadsheet_data or converted_from_crm
-        if should_sync:
+        if not self.raw_spreadsheet_data:
             try:
                 self._sync_sheets_with_order_lines()
             except Exception as e:
@@ -267,23 +255,6 @@ class SaleOrderSpreadsheet(models.Model):
         else:
             spreadsheet_json = data.get('data') or {}
 
-        # ✅ CRITICAL: Preload data for ALL sales lists
-        lists = spreadsheet_json.get('lists', {})
-        for list_id, list_config in lists.items():
-            try:
-                if list_id.startswith('sales_'):
-                    line_id = int(list_id.replace('sales_', ''))
-                else:
-                    line_id = int(list_id)
-                    
-                line = self.env['sale.order.line'].browse(line_id)
-                if line.exists():
-                    columns = list_config.get('columns', [])
-                    list_data = self.get_list_data('sale.order.line', list_id, columns)
-                    _logger.info(f"✅ Preloaded sales list {list_id}")
-            except Exception as e:
-                _logger.error(f"❌ Failed to preload {list_id}: {e}")
-
         data['data'] = spreadsheet_json
         
         # Add sales context
@@ -422,6 +393,10 @@ class SaleOrderSpreadsheet(models.Model):
 
     @api.model_create_multi
     def create(self, vals_list):
+        for vals in vals_list:
+            if not vals.get('raw_spreadsheet_data'):
+                # built here, in the current format
+                vals.setdefault('spreadsheet_format_version', SALES_FORMAT_VERSION)
         records = super().create(vals_list)
         for rec in records:
             if rec.order_id and rec.order_id.order_line and not rec.raw_spreadsheet_data:
@@ -429,6 +404,12 @@ class SaleOrderSpreadsheet(models.Model):
                     rec.with_context(order_line_id=line.id)._dispatch_insert_list_revision()
         return records
 
+    def write(self, vals):
+        if 'raw_spreadsheet_data' in vals and 'spreadsheet_format_version' not in vals:
+            # Data copied in from elsewhere: its format is checked on next open
+            vals = dict(vals, spreadsheet_format_version=SALES_FORMAT_UNVERSIONED)
+        return super().write(vals)
+
     def _empty_spreadsheet_data(self):
         """Return sales spreadsheet structure"""
         data = super()._empty_spreadsheet_data() or {}
@@ -443,31 +424,12 @@ class SaleOrderSpreadsheet(models.Model):
             list_id = f"sales_{line.id}"
             product_name = (line.product_id.display_name or "Untitled")[:31]
 
-            # Check for template
-            template_data = None
-            if line.product_id.product_tmpl_id.categ_id.spreadsheet_data:
-                try:
-                    template_data = json.loads(line.product_id.product_tmpl_id.categ_id.spreadsheet_data)
-                except Exception:
-                    pass
+            # Sanitized template sheets, shared by every line of the category
+            template_sheets = line.product_id.product_tmpl_id.categ_id._get_template_sheets()
 
-            if template_data and template_data.get('sheets'):
-                # Use template sheet
-                template_sheet = template_data['sheets'][0]
-                import copy
-                sheet_json = copy.deepcopy(template_sheet)
-                sheet_json['id'] = sheet_id
-                sheet_json['name'] = product_name
-                
-                # ✅ SANITIZE: Ensure all cell content is string AND remove invalid format
-                if 'cells' in sheet_json:
-                    for cell_key, cell_val in sheet_json['cells'].items():
-                        if 'content' in cell_val:
-                            cell_val['content'] = str(cell_val['content']) if cell_val['content'] is not None else ""
-                        if 'format' in cell_val:
-                            del cell_val['format']
-
-                data['sheets'].append(sheet_json)
+            if template_sheets:
+                # Use template sheet: only its id and name are its own
+                data['sheets'].append(dict(template_sheets[0], id=sheet_id, name=product_name))
             else:
                 data['sheets'].append({
                     'id': sheet_id,
@@ -614,7 +576,11 @@ class SaleOrderSpreadsheet(models.Model):
         except Exception:
             return True
 
-        self.raw_spreadsheet_data = data_json
+        # Saved by the client, which loaded upgraded data
+        self.write({
+            'raw_spreadsheet_data': data_json,
+            'spreadsheet_format_version': SALES_FORMAT_VERSION,
+        })
         _logger.info(f"✅ Saved: {len(data.get('lists', {}))} lists, {len(data.get('sheets', []))} sheets")
         return True
 
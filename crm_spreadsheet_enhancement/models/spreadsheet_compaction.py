@@ -0,0 +1,262 @@
+# -*- coding: utf-8 -*-
+import base64
+import json
+import logging
+import uuid
+
+from openpyxl.utils import get_column_letter
+from openpyxl.utils.cell import range_boundaries
+
+from odoo import api, models
+
+_logger = logging.getLogger(__name__)
+
+# Active revision log size past which a calculator is compacted
+# (0 disables the criterion).
+COMPACTION_REVISION_COUNT_PARAM = 'crm_spreadsheet_enhancement.compaction_revision_count'
+COMPACTION_REVISION_KB_PARAM = 'crm_spreadsheet_enhancement.compaction_revision_kb'
+DEFAULT_COMPACTION_REVISION_COUNT = 100
+DEFAULT_COMPACTION_REVISION_KB = 1024
+# Keys of the UPDATE_CELL commands _apply_commands_to_data can apply
+CELL_COMMAND_KEYS = {'type', 'sheetId', 'col', 'row', 'content'}
+
+
+class CrmSpreadsheetCompactionMixin(models.AbstractModel):
+    """
+    Calculator spreadsheets whose revision log is folded into a snapshot
+    once it grows past the configured thresholds.
+
+    Revisions only made of commands the server can apply (those emitted by
+    the line syncs) are folded by ``_cron_compact_revisions``. Logs holding
+    other user edits cannot be folded server side: the next editor opening
+    the spreadsheet is asked to snapshot it instead.
+    """
+    _name = 'crm.spreadsheet.compaction.mixin'
+    _inherit = 'spreadsheet.mixin'
+    _description = 'Calculator Spreadsheet Revision Compaction'
+
+    # ------------------------------------------------------------------
+    # SERVER SIDE COMMAND APPLICATION
+    # ------------------------------------------------------------------
+    @api.model
+    def _apply_commands_to_data(self, data, commands):
+        """
+        Apply the commands the calculators emit server side (line sheet
+        creation and deletion, consolidated sheet bands, see
+        ``crm.lead.spreadsheet._get_lines_insert_commands``) to spreadsheet
+        data, the way the client would when replaying them.
+
+        Only those command types are supported, and cells only carry
+        content: anything else raises ``ValueError``.
+        """
+        sheets = {sheet['id']: sheet for sheet in data.setdefault('sheets', [])}
+        lists = data.setdefault('lists', {})
+
+        def xc(col, row):
+            return f"{get_column_letter(col + 1)}{row + 1}"
+
+        def zone_xc(zone):
+            if isinstance(zone, str):
+                return zone
+            return f"{xc(zone['left'], zone['top'])}:{xc(zone['right'], zone['bottom'])}"
+
+        def fit(sheet, max_col, max_row):
+            # Grow the sheet to its content, like the template sheets are sized
+            sheet['colNumber'] = max(sheet.get('colNumber', 26), max_col or 0)
+            sheet['rowNumber'] = max(sheet.get('rowNumber', 100), max_row or 0)
+
+        def fit_range(sheet, range_xc):
+            _min_col, _min_row, max_col, max_row = range_boundaries(range_xc.split('!')[-1])
+            fit(sheet, max_col, max_row)
+            return range_xc
+
+        def set_cell(sheet, col, row, content):
+            # Like the client: only the content changes, the cell keeps its
+            # style and format
+            cell = sheet['cells'].get(xc(col, row), {})
+            if content:
+                sheet['cells'][xc(col, row)] = dict(cell, content=content)
+                fit(sheet, col + 1, row + 1)
+            else:
+                cell = {key: value for key, value in cell.items() if key != 'content'}
+                if cell:
+                    sheet['cells'][xc(col, row)] = cell
+                else:
+                    sheet['cells'].pop(xc(col, row), None)
+
+        for cmd in commands:
+            cmd_type = cmd['type']
+            sheet = sheets.get(cmd.get('sheetId'))
+            if cmd_type == 'CREATE_SHEET':
+                sheet = {
+                    'id': cmd['sheetId'], 'name': cmd['name'],
+                    'colNumber': 26, 'rowNumber': 100,
+                    'cells': {}, 'merges': [], 'cols': {}, 'rows': {},
+                }
+                data['sheets'].insert(cmd.get('position', len(data['sheets'])), sheet)
+                sheets[sheet['id']] = sheet
+            elif cmd_type == 'DELETE_SHEET':
+                data['sheets'].remove(sheets.pop(cmd['sheetId']))
+            elif cmd_type == 'UPDATE_CELL':
+                if set(cmd) - CELL_COMMAND_KEYS:
+                    raise ValueError(f"Unsupported cell attributes {sorted(set(cmd) - CELL_COMMAND_KEYS)}")
+                if 'content' in cmd:
+                    set_cell(sheet, cmd['col'], cmd['row'], cmd['content'])
+            elif cmd_type == 'DELETE_CONTENT':
+                for target in cmd['target']:
+                    for row in range(target['top'], target['bottom'] + 1):
+                        for col in range(target['left'], target['right'] + 1):
+                            set_cell(sheet, col, row, '')
+            elif cmd_type == 'ADD_MERGE':
+                sheet['merges'].extend(fit_range(sheet, zone_xc(target)) for target in cmd['target'])
+            elif cmd_type == 'RESIZE_COLUMNS_ROWS':
+                key = 'cols' if cmd['dimension'] == 'COL' else 'rows'
+                for element in cmd['elements']:
+                    sheet[key][str(element)] = {'size': cmd['size']}
+            elif cmd_type == 'ADD_DATA_VALIDATION_RULE':
+                sheet.setdefault('dataValidationRules', []).append(
+                    dict(cmd['rule'], ranges=[fit_range(sheet, zone_xc(r)) for r in cmd['ranges']])
+                )
+            elif cmd_type == 'CREATE_TABLE':
+                for table_range in cmd['ranges']:
+                    sheet.setdefault('tables', []).append({
+                        'range': fit_range(sheet, zone_xc(table_range['_zone'])),
+                        'type': cmd.get('tableType', 'static'),
+                        'config': cmd.get('config', {}),
+                    })
+            elif cmd_type == 'REGISTER_ODOO_LIST':
+                definition = {k: v for k, v in cmd.items() if k not in ('type', 'listId')}
+                lists[cmd['listId']] = dict(definition, id=cmd['listId'])
+            elif cmd_type == 'UNREGISTER_ODOO_LIST':
+                lists.pop(cmd['listId'], None)
+            elif cmd_type == 'RE_INSERT_ODOO_LIST':
+                list_id = cmd['id']
+                for offset, column in enumerate(cmd['columns']):
+                    col = cmd['col'] + offset
+                    set_cell(sheet, col, cmd['row'], f'=ODOO.LIST.HEADER({list_id},"{column["name"]}")')
+                    for index in range(1, cmd['linesNumber'] + 1):
+                        set_cell(sheet, col, cmd['row'] + index, f'=ODOO.LIST({list_id},{index},"{column["name"]}")')
+            elif cmd_type == 'UPDATE_ODOO_LIST_DATA':
+                continue
+            else:
+                raise ValueError(f"Unsupported command {cmd_type}")
+
+        list_ids = [int(list_id) for list_id in lists if str(list_id).isdigit()]
+        if list_ids:
+            data['listNextId'] = max(list_ids + [data.get('listNextId') or 0]) + 1
+        return data
+
+    # ------------------------------------------------------------------
+    # REVISION COMPACTION
+    # ------------------------------------------------------------------
+    @api.model
+    def _cron_compact_revisions(self):
+        """
+        Fold the revision log of the spreadsheets past the thresholds into
+        a new snapshot.
+
+        :return: ``{'spreadsheets', 'revisions', 'bytes'}``: number of
+            spreadsheets compacted, revisions and command bytes removed from
+            the replay log
+        """
+        candidates = self._search_compaction_candidates()
+        report = {'spreadsheets': 0, 'revisions': 0, 'bytes': 0}
+        for spreadsheet in candidates:
+            revision_count, byte_count = spreadsheet._compact_revisions()
+            if revision_count:
+                report['spreadsheets'] += 1
+                report['revisions'] += revision_count
+                report['bytes'] += byte_count
+        _logger.info(
+            f"🗜️ Compacted {report['spreadsheets']}/{len(candidates)} {self._name} records: "
+            f"{report['revisions']} revisions, {report['bytes']} bytes removed from the replay log"
+        )
+        return report
+
+    @api.model
+    def _search_compaction_candidates(self, res_ids=None):
+        """Spreadsheets (among ``res_ids`` if given) whose active revision log passes a threshold."""
+        config = self.env['ir.config_parameter'].sudo()
+        max_count = int(config.get_param(COMPACTION_REVISION_COUNT_PARAM, DEFAULT_COMPACTION_REVISION_COUNT))
+        max_kb = int(config.get_param(COMPACTION_REVISION_KB_PARAM, DEFAULT_COMPACTION_REVISION_KB))
+        if max_count <= 0 and max_kb <= 0:
+            return self.browse()
+
+        self.env['spreadsheet.revision'].flush_model(['res_model', 'res_id', 'active', 'commands'])
+        # NULL thresholds never match: a disabled criterion selects nothing
+        self.env.cr.execute("""
+            SELECT res_id
+              FROM spreadsheet_revision
+             WHERE res_model = %s
+               AND active
+               AND (%s::int[] IS NULL OR res_id = ANY(%s::int[]))
+             GROUP BY res_id
+            HAVING COUNT(*) >= %s
+                OR SUM(octet_length(commands)) >= %s
+        """, [
+            self._name, res_ids, res_ids,
+            max_count if max_count > 0 else None,
+            max_kb * 1024 if max_kb > 0 else None,
+        ])
+        return self.browse([row[0] for row in self.env.cr.fetchall()]).exists()
+
+    def _compact_revisions(self):
+        """
+        Fold the active revisions into a new snapshot.
+
+        The snapshot goes through the regular ``SNAPSHOT`` message, based on
+        the last revision: if a collaborator saved a revision in the
+        meantime the snapshot is refused and nothing changes. Connected
+        clients are notified of the new snapshot like for client snapshots.
+
+        :return: ``(revision count, bytes)`` removed from the replay log,
+            ``(0, 0)`` when nothing was folded
+        """
+        self.ensure_one()
+        revisions = self.env['spreadsheet.revision'].sudo().search([
+            ('res_model', '=', self._name),
+            ('res_id', '=', self.id),
+        ], order='id')
+        if not revisions:
+            return 0, 0
+
+        snapshot = self.spreadsheet_snapshot
+        data_json = base64.b64decode(snapshot) if snapshot else self.spreadsheet_data
+        if not data_json:
+            return 0, 0
+
+        commands = []
+        for revision in revisions:
+            message = json.loads(revision.commands)
+            if message.get('type') == 'SNAPSHOT_CREATED':
+                continue
+            if message.get('type') != 'REMOTE_REVISION':
+                _logger.info(f"⏭️ Spreadsheet {self._name}({self.id}) not compacted: {message.get('type')} revision")
+                return 0, 0
+            commands.extend(message.get('commands') or [])
+
+        try:
+            data = self._apply_commands_to_data(json.loads(data_json), commands)
+        except (AttributeError, KeyError, TypeError, ValueError) as e:
+            _logger.info(f"⏭️ Spreadsheet {self._name}({self.id}) not compacted: {e}")
+            return 0, 0
+
+        next_revision_id = str(uuid.uuid4())
+        data['revisionId'] = next_revision_id
+        is_accepted = self.dispatch_spreadsheet_message({
+            'type': 'SNAPSHOT',
+            'serverRevisionId': revisions[-1].revision_uuid,
+            'nextRevisionId': next_revision_id,
+            'data': data,
+        })
+        if not is_accepted:
+            _logger.info(f"⏭️ Spreadsheet {self._name}({self.id}) not compacted: concurrent revision")
+            return 0, 0
+
+        byte_count = sum(len(revision.commands.encode()) for revision in revisions)
+        _logger.info(f"🗜️ Spreadsheet {self._name}({self.id}): {len(revisions)} revisions ({byte_count} bytes) folded")
+        return len(revisions), byte_count
+
+    def _should_be_snapshotted(self):
+        # Logs the server could not fold are snapshotted by the next editor
+        return super()._should_be_snapshotted() or bool(self._search_compaction_candidates(self.ids))
@@ -81,8 +81,11 @@ export class SpreadsheetFieldSyncAction extends AbstractSpreadsheetAction {
             // ✅ Save line data
             if (this.spreadsheetType === 'crm' && this.leadId) {
                 console.log(`💾 Writing to crm.lead ${this.leadId}`);
+                // Tag the write with its origin so the server does not resync this spreadsheet
                 await this.orm.write("crm.lead", [this.leadId], {
                     material_line_ids: commands,
+                }, {
+                    context: { spreadsheet_origin_id: this.spreadsheetId },
                 });
 
             } else if (this.spreadsheetType === 'sale' && this.saleOrderId) {
@@ -24,6 +24,28 @@ const {
 
 coreTypes.add("ADD_FIELD_SYNC").add("DELETE_FIELD_SYNCS");
 
+const LIST_HEADER_REGEX = /ODOO\.LIST\.HEADER\(\s*"?([^",\s)]+)"?\s*,/i;
+
+/**
+ * Id of the list of the band holding a position, on a sheet with one band
+ * per record (consolidated CRM calculator): the list of the nearest list
+ * header at or above the position.
+ */
+function getBandListId(getters, position, listIds) {
+    const { sheetId } = position;
+    const numberOfCols = getters.getNumberCols(sheetId);
+    for (let row = position.row; row >= 0; row--) {
+        for (let col = 0; col < numberOfCols; col++) {
+            const content = getters.getCell({ sheetId, col, row })?.content;
+            const match = content && LIST_HEADER_REGEX.exec(content);
+            if (match && listIds.has(match[1])) {
+                return match[1];
+            }
+        }
+    }
+    return null;
+}
+
 /**
  * Adds the spreadsheet field sync plugins and menus
  * and removes them when the action is left.
@@ -67,10 +89,17 @@ export function addSpreadsheetFieldSyncExtensionWithCleanUp(cleanUpHook = () =>
             const lists = env.model.getters.getMainLists() || [];
             const activeSheetId = env.model.getters.getActiveSheetId();
 
-            // Choose target list: prefer list matching active sheet, otherwise first list
+            // Choose target list: prefer list matching active sheet (the one
+            // of the band of the cell when the sheet has several), otherwise first list
             let targetList = null;
             if (lists.length) {
-                targetList = lists.find((l) => l.sheetId === activeSheetId) || lists[0];
+                const sheetLists = lists.filter((l) => l.sheetId === activeSheetId);
+                if (sheetLists.length > 1) {
+                    const listIds = new Set(sheetLists.map((l) => String(l.id)));
+                    const bandListId = getBandListId(env.model.getters, position, listIds);
+                    targetList = sheetLists.find((l) => String(l.id) === bandListId);
+                }
+                targetList = targetList || sheetLists[0] || lists[0];
             }
 
             const isNewlyCreate = Boolean(!fieldSync && targetList);
@@ -81,6 +110,7 @@ export function addSpreadsheetFieldSyncExtensionWithCleanUp(cleanUpHook = () =>
                     col: position.col,
                     row: position.row,
                     listId: targetList.id,
+                    // Lists hold one record: a line sheet or a band of the consolidated sheet
                     indexInList: 0,
                     fieldName: targetList.model === 'sale.order.line' ? "product_uom_qty" : "quantity",
                 });
@@ -109,17 +109,11 @@ export class FieldSyncUIPlugin extends OdooUIPlugin {
 
                 console.log(`📋 Processing list: ${list.id} (${list.name}) from sheet: ${list.sheetId}`);
 
-                const recordId = await this.getRecordIdFromList(list.id, 0);
-
-                if (!recordId) {
-                    console.error(`❌ No record ID for list ${list.id}, skipping`);
-                    errors.push(`No record found for list ${list.id}`);
-                    continue;
-                }
-
-                console.log(`✅ List ${list.id} -> Record ID: ${recordId}`);
-
-                const recordUpdates = {};
+                // A list holds one record per line sheet, or every line of
+                // the lead on a consolidated sheet: updates are grouped per
+                // record, resolved from the field sync position in the list
+                const recordIds = new Map();
+                const updatesByRecord = new Map();
                 const allFieldSyncs = [...this.getters.getAllFieldSyncs()];
 
                 for (const [position, fieldSync] of allFieldSyncs) {
@@ -135,6 +129,17 @@ export class FieldSyncUIPlugin extends OdooUIPlugin {
                         continue;
                     }
 
+                    const index = fieldSync.indexInList || 0;
+                    if (!recordIds.has(index)) {
+                        recordIds.set(index, await this.getRecordIdFromList(list.id, index));
+                    }
+                    const recordId = recordIds.get(index);
+                    if (!recordId) {
+                        console.error(`❌ No record ID for list ${list.id} at index ${index}, skipping`);
+                        errors.push(`No record found for list ${list.id}`);
+                        continue;
+                    }
+
                     // ✅ Use formattedValue for all fields
                     let serverValue;
 
@@ -146,14 +151,18 @@ export class FieldSyncUIPlugin extends OdooUIPlugin {
                         serverValue = cell.formattedValue || cell.value || "";
                     }
 
-                    recordUpdates[fieldName] = serverValue;
+                    if (!updatesByRecord.has(recordId)) {
+                        updatesByRecord.set(recordId, {});
+                    }
+                    updatesByRecord.get(recordId)[fieldName] = serverValue;
                     console.log(`📝 Field ${fieldName} = ${serverValue} from sheet: ${position.sheetId}`);
                 }
 
-                if (Object.keys(recordUpdates).length > 0) {
+                for (const [recordId, recordUpdates] of updatesByRecord) {
                     commands.push(x2ManyCommands.update(recordId, recordUpdates));
                     console.log(`✅ Command created for record ${recordId}:`, recordUpdates);
-                } else {
+                }
+                if (!updatesByRecord.size) {
                     console.log(`⚠️ No updates for list ${list.id}`);
                 }
             }
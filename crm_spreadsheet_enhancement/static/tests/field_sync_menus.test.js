@@ -2,6 +2,7 @@ import { describe, before, expect, test } from "@odoo/hoot";
 import { registries } from "@odoo/o-spreadsheet";
 import { mailModels } from "@mail/../tests/mail_test_helpers";
 import { defineModels } from "@web/../tests/web_test_helpers";
+import { createModelWithDataSource } from "@spreadsheet/../tests/helpers/model";
 
 import { addFieldSync, createSaleOrderSpreadsheetModel } from "./helpers/commands";
 import { addSpreadsheetFieldSyncExtensionWithCleanUp } from "../src/bundle/field_sync/field_sync_extension_hook";
@@ -43,6 +44,45 @@ describe("field sync menus", () => {
         expect.verifySteps(["FieldSyncSidePanel"]);
     });
 
+    test("add a field sync in a band of a sheet with one list per band", async () => {
+        const bandList = (id) => ({
+            columns: ["product_id", "product_uom_qty"],
+            domain: [["id", "=", id]],
+            model: "sale.order.line",
+            context: {},
+            orderBy: [],
+            id: String(id),
+            name: `Line ${id}`,
+            sheetId: "crm_lines",
+        });
+        const model = await createModelWithDataSource({
+            spreadsheetData: {
+                sheets: [
+                    {
+                        id: "crm_lines",
+                        cells: {
+                            A1: { content: '=ODOO.LIST.HEADER(1,"product_id")' },
+                            A5: { content: '=ODOO.LIST.HEADER(2,"product_id")' },
+                        },
+                    },
+                ],
+                lists: { 1: bandList(1), 2: bandList(2) },
+            },
+        });
+        const env = {
+            ...model.config.custom.env,
+            model,
+            openSidePanel() {},
+        };
+        selectCell(model, "B6");
+        await doMenuAction(cellMenuRegistry, ["add_field_sync"], env);
+        expect(getFieldSync(model, "B6")).toEqual({
+            listId: "2",
+            indexInList: 0,
+            fieldName: "product_uom_qty",
+        });
+    });
+
     test("delete a field sync at the selected cell", async () => {
         const model = await createSaleOrderSpreadsheetModel();
         addFieldSync(model, "B2", "product_uom_qty", 0);
@@ -0,0 +1,6 @@
+# -*- coding: utf-8 -*-
+
+from . import test_apply_commands
+from . import test_consolidated_layout
+from . import test_reference_sheets
+from . import test_template_ingestion
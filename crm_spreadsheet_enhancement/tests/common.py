@@ -0,0 +1,66 @@
+# -*- coding: utf-8 -*-
+import base64
+from io import BytesIO
+
+import openpyxl
+
+from odoo.tests.common import TransactionCase
+
+
+def make_template_xlsx():
+    """Calculator template: a costing sheet reading the line, and a static
+    Profile Master sheet (reference data)."""
+    wb = openpyxl.Workbook()
+    costing = wb.active
+    costing.title = "Costing"
+    costing["A1"] = "Width"
+    costing["B1"] = "=A1"
+    costing["A2"] = "Total"
+    costing["B2"] = "=B1*2"
+    profiles = wb.create_sheet("Profile Master")
+    profiles.append(["Profile", "Weight"])
+    profiles.append(["P-10", 1.5])
+    profiles.append(["P-20", 2.5])
+    output = BytesIO()
+    wb.save(output)
+    return base64.b64encode(output.getvalue())
+
+
+class CalculatorCase(TransactionCase):
+
+    @classmethod
+    def setUpClass(cls):
+        super().setUpClass()
+        cls.category = cls.env['product.category'].create({
+            'name': 'Calculator Category',
+            'template_file': make_template_xlsx(),
+            'template_filename': 'template.xlsx',
+            'serve_reference_sheets': True,
+        })
+        cls.product_template = cls.env['product.template'].create({
+            'name': 'Window',
+            'categ_id': cls.category.id,
+            'sale_ok': True,
+        })
+        cls.lead = cls.env['crm.lead'].create({
+            'name': 'Calculator Lead',
+            'type': 'opportunity',
+        })
+
+    def add_lines(self, count):
+        return self.env['crm.material.line'].create([{
+            'lead_id': self.lead.id,
+            'product_template_id': self.product_template.id,
+            'product_id': self.product_template.product_variant_id.id,
+            'quantity': index + 1,
+            'width': 100 * (index + 1),
+        } for index in range(count)])
+
+    def create_calculator(self, layout='per_line', creation_mode='snapshot'):
+        self.env['ir.config_parameter'].sudo().set_param(
+            'crm_spreadsheet_enhancement.calculator_creation_mode', creation_mode)
+        return self.env['crm.lead.spreadsheet'].create({
+            'name': 'Calculator',
+            'lead_id': self.lead.id,
+            'calculator_layout': layout,
+        })
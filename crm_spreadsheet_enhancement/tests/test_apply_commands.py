@@ -0,0 +1,38 @@
+# -*- coding: utf-8 -*-
+from odoo.tests.common import TransactionCase
+
+
+class TestApplyCommands(TransactionCase):
+
+    def apply(self, data, commands):
+        return self.env['crm.lead.spreadsheet']._apply_commands_to_data(data, commands)
+
+    def test_update_cell_keeps_style_and_format(self):
+        data = {'sheets': [{
+            'id': 's1', 'name': 'Costing', 'cells': {
+                'A1': {'content': 'old', 'style': 3, 'format': 1},
+                'B1': {'content': '=A1', 'style': 2},
+            },
+            'merges': [], 'cols': {}, 'rows': {},
+        }]}
+        self.apply(data, [
+            {'type': 'UPDATE_CELL', 'sheetId': 's1', 'col': 0, 'row': 0, 'content': 'new'},
+            {'type': 'UPDATE_CELL', 'sheetId': 's1', 'col': 1, 'row': 0, 'content': ''},
+        ])
+        cells = data['sheets'][0]['cells']
+        self.assertEqual(cells['A1'], {'content': 'new', 'style': 3, 'format': 1})
+        self.assertEqual(cells['B1'], {'style': 2})
+
+    def test_delete_content_keeps_style(self):
+        data = {'sheets': [{
+            'id': 's1', 'name': 'Costing', 'cells': {
+                'A1': {'content': '1', 'style': 3},
+                'A2': {'content': '2'},
+            },
+            'merges': [], 'cols': {}, 'rows': {},
+        }]}
+        self.apply(data, [{
+            'type': 'DELETE_CONTENT', 'sheetId': 's1',
+            'target': [{'top': 0, 'bottom': 1, 'left': 0, 'right': 0}],
+        }])
+        self.assertEqual(data['sheets'][0]['cells'], {'A1': {'style': 3}})
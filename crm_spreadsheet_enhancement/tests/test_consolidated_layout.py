@@ -0,0 +1,61 @@
+# -*- coding: utf-8 -*-
+import json
+
+from .common import CalculatorCase
+
+
+class TestConsolidatedLayout(CalculatorCase):
+
+    def get_revision_commands(self, calculator):
+        revisions = self.env['spreadsheet.revision'].search([
+            ('res_model', '=', calculator._name),
+            ('res_id', '=', calculator.id),
+        ], order='id')
+        return [
+            command
+            for revision in revisions
+            for command in json.loads(revision.commands).get('commands') or []
+        ]
+
+    def test_revision_mode_creates_consolidated_sheet_once(self):
+        first = self.add_lines(1)
+        calculator = self.create_calculator(layout='consolidated', creation_mode='revisions')
+        first_top = calculator._get_line_bands()[first.id]['top']
+
+        second = self.add_lines(1)
+        calculator._sync_line_bands()
+
+        created = [
+            command for command in self.get_revision_commands(calculator)
+            if command['type'] == 'CREATE_SHEET' and command['sheetId'] == 'crm_lines'
+        ]
+        self.assertEqual(len(created), 1)
+        bands = calculator._get_line_bands()
+        self.assertEqual(bands[first.id]['top'], first_top)
+        self.assertGreater(bands[second.id]['top'], first_top)
+
+    def test_each_band_has_the_list_of_its_line(self):
+        first, second = self.add_lines(2).sorted('id')
+        calculator = self.create_calculator(layout='consolidated', creation_mode='snapshot')
+        data = json.loads(calculator.spreadsheet_data)
+        bands = calculator._get_line_bands()
+
+        # Field syncs of band 2 (index 0 of its list) write back to line 2
+        band_list = data['lists'][str(second.id)]
+        self.assertEqual(band_list['domain'], [['id', '=', second.id]])
+        self.assertEqual(band_list['sheetId'], 'crm_lines')
+        self.assertNotIn('crm_lines', data['lists'])
+        sheet = next(sheet for sheet in data['sheets'] if sheet['id'] == 'crm_lines')
+        header = sheet['cells'][f"A{bands[second.id]['top'] + 1}"]['content']
+        self.assertEqual(header, f'=ODOO.LIST.HEADER({second.id},"{bands[second.id]["columns"][0]}")')
+
+        # Removing line 1 keeps the list of band 2 on line 2
+        first.unlink()
+        calculator._sync_line_bands()
+        commands = self.get_revision_commands(calculator)
+        self.assertIn({'type': 'UNREGISTER_ODOO_LIST', 'listId': str(first.id)}, commands)
+        self.assertFalse([
+            command for command in commands
+            if command.get('listId') == str(second.id)
+        ])
+        self.assertEqual(list(calculator._get_line_bands()), [second.id])
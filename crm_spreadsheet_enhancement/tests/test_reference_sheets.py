@@ -0,0 +1,20 @@
+# -*- coding: utf-8 -*-
+from .common import CalculatorCase
+
+
+class TestReferenceSheets(CalculatorCase):
+
+    def test_reference_sheets_imported_with_template(self):
+        references = self.env['crm.reference.sheet'].search([
+            ('template_checksum', '=', self.category.template_checksum),
+        ])
+        self.assertEqual(references.mapped('name'), ['Profile Master'])
+
+    def test_snapshot_calculator_keeps_reference_links(self):
+        self.add_lines(2)
+        calculator = self.create_calculator(creation_mode='snapshot')
+        self.assertTrue(calculator.spreadsheet_data)
+        self.assertEqual(calculator.reference_sheet_ids.mapped('name'), ['Profile Master'])
+
+        data = calculator.join_spreadsheet_session()['data']
+        self.assertIn('Profile Master', [sheet['name'] for sheet in data['sheets']])
@@ -0,0 +1,45 @@
+# -*- coding: utf-8 -*-
+from unittest.mock import patch
+
+from odoo.tests.common import TransactionCase
+
+from odoo.addons.crm_spreadsheet_enhancement.models import product_category
+from .common import make_template_xlsx
+
+
+class TestTemplateIngestion(TransactionCase):
+
+    @classmethod
+    def setUpClass(cls):
+        super().setUpClass()
+        cls.Category = cls.env['product.category']
+        cls.template = make_template_xlsx()
+
+    def tearDown(self):
+        product_category._streaming_reader_available.cache_clear()
+        super().tearDown()
+
+    def test_streaming_reader_parses_template(self):
+        self.assertTrue(product_category._streaming_reader_available())
+        data = self.Category._convert_excel_streaming(self.template)
+
+        sheets = {sheet['name']: sheet for sheet in data['sheets']}
+        self.assertEqual(list(sheets), ['Costing', 'Profile Master'])
+        self.assertEqual(sheets['Costing']['cells']['A1'], {'content': 'Width'})
+        self.assertEqual(sheets['Costing']['cells']['B2'], {'content': '=B1*2'})
+        self.assertEqual(sheets['Profile Master']['cells']['B3'], {'content': '2.5'})
+
+    def test_streaming_reader_matches_full_load(self):
+        self.assertEqual(
+            self.Category._convert_excel_streaming(self.template),
+            self.Category._convert_excel_full(self.template),
+        )
+
+    def test_unchecked_openpyxl_uses_full_load(self):
+        product_category._streaming_reader_available.cache_clear()
+        with patch.object(product_category, 'STREAMING_OPENPYXL_VERSIONS', set()), \
+                patch.object(type(self.Category), '_convert_excel_streaming') as streaming, \
+                self.assertLogs(product_category.__name__, 'WARNING'):
+            data = self.Category._convert_excel_to_spreadsheet(self.template)
+        streaming.assert_not_called()
+        self.assertEqual([sheet['name'] for sheet in data['sheets']], ['Costing', 'Profile Master'])